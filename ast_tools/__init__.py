@@ -2,7 +2,11 @@
 ast_tools top level package
 """
 from .common import *
+from . import columnar
 from . import immutable_ast
 from . import passes
+from . import scopes
+from . import serialize
+from . import store
 from . import stack
 from . import visitors
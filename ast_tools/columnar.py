@@ -0,0 +1,319 @@
+"""
+Defines a columnar representation of an AST
+
+Nodes are numbered in preorder and described by parallel arrays, so that
+queries over a whole tree are scans over flat buffers instead of walks over
+python objects:
+
+    kinds[i]    code of the type of node i in `types`
+    parents[i]  index of the parent of node i, -1 for the root
+    ends[i]     index one past the last descendant of node i, the children
+                of i are i + 1, ends[i + 1], ... up to ends[i]
+    fields[i]   code of the field of the parent holding node i in
+                `field_names`
+    ctx[i]      expression context of node i (NO_CTX, LOAD, STORE or DEL),
+                contexts are not nodes of the columnar tree
+    idents[i]   id in `strings` of the identifier of node i (the id of a
+                Name, the name of a def, the attr of an Attribute, ...)
+                or -1
+"""
+import array
+import ast
+import re
+import typing as tp
+
+__ALL__ = ['ColumnarTree', 'NO_CTX', 'LOAD', 'STORE', 'DEL']
+
+NO_CTX = 0
+LOAD = 1
+STORE = 2
+DEL = 3
+
+_CTX_CODES = {ast.Load: LOAD, ast.Store: STORE, ast.Del: DEL}
+_CTX_TYPES = {code: t for t, code in _CTX_CODES.items()}
+
+# The field of each node type stored in idents
+_IDENT_FIELDS = {
+    ast.Name: 'id',
+    ast.Attribute: 'attr',
+    ast.FunctionDef: 'name',
+    ast.AsyncFunctionDef: 'name',
+    ast.ClassDef: 'name',
+    ast.arg: 'arg',
+    ast.keyword: 'arg',
+    ast.alias: 'name',
+    ast.ExceptHandler: 'name',
+}
+
+_POSITIONS = ('lineno', 'col_offset', 'end_lineno', 'end_col_offset')
+
+_SIGNATURE = re.compile(r'(\w+)([?*]?) (\w+)')
+
+# node type -> fields which are sequences
+_SEQ_FIELDS = {}
+
+
+def _seq_fields(node_type: type) -> tp.FrozenSet[str]:
+    try:
+        return _SEQ_FIELDS[node_type]
+    except KeyError:
+        pass
+    doc = (node_type.__doc__ or '').split('\n', 1)[0]
+    fields = _SEQ_FIELDS[node_type] = frozenset(
+        field for _, mod, field in _SIGNATURE.findall(doc) if mod == '*'
+    )
+    return fields
+
+
+class _Child:
+    # Pickled by reference so that it stays a singleton
+    def __reduce__(self):
+        return '_CHILD'
+
+
+# Marks the positions of nodes in list fields which also hold non nodes
+# (e.g. the None keys of Dict)
+_CHILD = _Child()
+
+
+def _find_all(buffer: bytes, code: int) -> tp.List[int]:
+    '''Indices of code in buffer'''
+    result = []
+    target = bytes((code,))
+    find = buffer.find
+    i = find(target)
+    while i >= 0:
+        result.append(i)
+        i = find(target, i + 1)
+    return result
+
+
+class ColumnarTree:
+    '''
+    An AST stored as flat arrays (see the module docstring).  Fields which
+    are neither nodes nor identifiers are kept per node in `scalars`.
+
+    When built from an AST `nodes` holds the original nodes, so that the
+    results of queries can be mapped back to them.
+    '''
+    def __init__(self):
+        self.types = []
+        self.field_names = []
+        self.strings = []
+        self._type_codes = {}
+        self._field_codes = {}
+        self._string_ids = {}
+        self.kinds = array.array('B')
+        self.parents = array.array('i')
+        self.ends = array.array('i')
+        self.fields = array.array('B')
+        self.ctx = array.array('B')
+        self.idents = array.array('i')
+        self.positions = array.array('i')
+        self.scalars = {}
+        self.nodes = None
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def type_code(self, node_type: type) -> int:
+        try:
+            return self._type_codes[node_type]
+        except KeyError:
+            pass
+        code = len(self.types)
+        if code > 0xff:
+            raise ValueError('Too many node types')
+        self.types.append(node_type)
+        self._type_codes[node_type] = code
+        return code
+
+    def field_code(self, field: str) -> int:
+        try:
+            return self._field_codes[field]
+        except KeyError:
+            pass
+        code = len(self.field_names)
+        if code >= 0xff:
+            raise ValueError('Too many fields')
+        self.field_names.append(field)
+        self._field_codes[field] = code
+        return code
+
+    def string_id(self, s: str) -> int:
+        try:
+            return self._string_ids[s]
+        except KeyError:
+            pass
+        idx = self._string_ids[s] = len(self.strings)
+        self.strings.append(s)
+        return idx
+
+    @classmethod
+    def from_ast(cls, tree: ast.AST) -> 'ColumnarTree':
+        self = cls()
+        kinds = self.kinds
+        parents = self.parents
+        fields = self.fields
+        ctx = self.ctx
+        idents = self.idents
+        positions = self.positions
+        scalars = self.scalars
+        self.nodes = nodes = []
+        type_code = self.type_code
+        field_code = self.field_code
+        string_id = self.string_id
+
+        # (node, parent, field code)
+        todo = [(tree, -1, 0xff)]
+        while todo:
+            node, parent, field = todo.pop()
+            idx = len(nodes)
+            nodes.append(node)
+            node_type = type(node)
+            kinds.append(type_code(node_type))
+            parents.append(parent)
+            fields.append(field)
+            ident_field = _IDENT_FIELDS.get(node_type)
+            ident = getattr(node, ident_field, None) if ident_field else None
+            idents.append(-1 if ident is None else string_id(ident))
+            for attr in _POSITIONS:
+                value = getattr(node, attr, None)
+                positions.append(-1 if value is None else value)
+
+            node_ctx = NO_CTX
+            children = []
+            extra = None
+            for name in node._fields:
+                if name == ident_field:
+                    continue
+                value = getattr(node, name, None)
+                if isinstance(value, ast.expr_context):
+                    node_ctx = _CTX_CODES[type(value)]
+                elif isinstance(value, ast.AST):
+                    children.append((value, idx, field_code(name)))
+                elif isinstance(value, list) and name in _seq_fields(node_type) \
+                        and all(isinstance(c, ast.AST) for c in value):
+                    code = field_code(name)
+                    children.extend((c, idx, code) for c in value)
+                elif value is None and name not in _seq_fields(node_type):
+                    # node_fields defaults missing fields to None
+                    continue
+                else:
+                    if isinstance(value, list):
+                        code = field_code(name)
+                        children.extend(
+                            (c, idx, code) for c in value if isinstance(c, ast.AST))
+                        value = [_CHILD if isinstance(c, ast.AST) else c for c in value]
+                    if extra is None:
+                        extra = scalars[idx] = {}
+                    extra[name] = value
+            ctx.append(node_ctx)
+            todo.extend(reversed(children))
+
+        n = len(kinds)
+        ends = self.ends = array.array('i', range(1, n + 1))
+        for i in range(n - 1, 0, -1):
+            p = parents[i]
+            if ends[i] > ends[p]:
+                ends[p] = ends[i]
+        return self
+
+    def children(self, idx: int) -> tp.Iterator[int]:
+        ends = self.ends
+        end = ends[idx]
+        idx += 1
+        while idx < end:
+            yield idx
+            idx = ends[idx]
+
+    def codes_of(self, node_type: tp.Union[type, tp.Tuple[type, ...]]) -> tp.List[int]:
+        '''Codes of the types in the tree which are subclasses of node_type'''
+        return [code for code, t in enumerate(self.types) if issubclass(t, node_type)]
+
+    def find(self, node_type: tp.Union[type, tp.Tuple[type, ...]]) -> tp.List[int]:
+        '''Indices of the nodes which are instances of node_type, in preorder'''
+        codes = self.codes_of(node_type)
+        kinds = self.kinds.tobytes()
+        if len(codes) == 1:
+            return _find_all(kinds, codes[0])
+        result = []
+        for code in codes:
+            result.extend(_find_all(kinds, code))
+        result.sort()
+        return result
+
+    def find_field(self, field: str) -> tp.List[int]:
+        '''Indices of the nodes held by field of their parent, in preorder'''
+        try:
+            code = self._field_codes[field]
+        except KeyError:
+            return []
+        return _find_all(self.fields.tobytes(), code)
+
+    def node_fields(self,
+            idx: int,
+            make_child: tp.Callable[[int], tp.Any],
+            seq_t: type = list,
+            module: tp.Any = ast) -> tp.Dict[str, tp.Any]:
+        '''
+        Values of the fields of node idx.  Children are made by
+        make_child(index), sequences by seq_t and expression contexts are
+        taken from module (ast or immutable_ast).
+        '''
+        field_names = self.field_names
+        fields = self.fields
+        by_field = {}
+        for c in self.children(idx):
+            by_field.setdefault(field_names[fields[c]], []).append(c)
+
+        node_type = self.types[self.kinds[idx]]
+        extra = self.scalars.get(idx, {})
+        seq_fields = _seq_fields(node_type)
+        values = {}
+        for name in node_type._fields:
+            if name in extra:
+                value = extra[name]
+                if isinstance(value, list):
+                    it = iter(by_field.get(name, ()))
+                    value = seq_t(
+                        make_child(next(it)) if c is _CHILD else c for c in value)
+            elif name in by_field:
+                value = by_field[name]
+                if name in seq_fields:
+                    value = seq_t(map(make_child, value))
+                else:
+                    value = make_child(*value)
+            elif name == 'ctx' and self.ctx[idx] != NO_CTX:
+                value = getattr(module, _CTX_TYPES[self.ctx[idx]].__name__)()
+            elif name == _IDENT_FIELDS.get(node_type):
+                ident = self.idents[idx]
+                value = None if ident < 0 else self.strings[ident]
+            elif name in seq_fields:
+                value = seq_t()
+            else:
+                value = None
+            values[name] = value
+        return values
+
+    def to_ast(self, idx: int = 0) -> ast.AST:
+        '''Builds a new AST of the subtree rooted at node idx'''
+        types = self.types
+        kinds = self.kinds
+        positions = self.positions
+        built = [None] * (self.ends[idx] - idx)
+
+        def make_child(c):
+            return built[c - idx]
+
+        # Children follow their parent so are built first in reverse order
+        for i in range(self.ends[idx] - 1, idx - 1, -1):
+            node = types[kinds[i]]()
+            for name, value in self.node_fields(i, make_child).items():
+                setattr(node, name, value)
+            for k, attr in enumerate(_POSITIONS):
+                value = positions[4 * i + k]
+                if value >= 0:
+                    setattr(node, attr, value)
+            built[i - idx] = node
+        return built[0]
@@ -15,7 +15,7 @@ from ast_tools import stack
 from ast_tools.stack import SymbolTable
 from ast_tools.visitors import used_names
 
-__ALL__ = ['exec_in_file', 'exec_def_in_file', 'get_ast', 'gen_free_name']
+__ALL__ = ['exec_in_file', 'exec_def_in_file', 'get_ast', 'gen_free_name', 'clone']
 
 DefStmt = tp.Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]
 
@@ -142,3 +142,78 @@ def gen_free_prefix(
         prefix = f_str.format(c)
 
     return prefix
+
+
+# node type -> fields and attributes to copy
+_CLONE_FIELDS = {}
+# node types which have no fields e.g. Load, Add, And
+_FIELDLESS = (ast.expr_context, ast.boolop, ast.operator, ast.unaryop, ast.cmpop)
+_CONSTANTS = (ast.Constant, ast.Num, ast.Str, ast.Bytes, ast.NameConstant)
+
+def _clone_fields(cls: type) -> tp.Tuple[str, ...]:
+    try:
+        return _CLONE_FIELDS[cls]
+    except KeyError:
+        pass
+    fields = _CLONE_FIELDS[cls] = cls._fields + getattr(cls, '_attributes', ())
+    return fields
+
+
+def clone(
+        tree: tp.Union[ast.AST, tp.List],
+        share_leaves: bool = False,
+        substitute: tp.Optional[tp.Mapping[int, ast.AST]] = None):
+    """
+    Fast replacement for copy.deepcopy on ASTs.
+
+    Copies the `_fields` and `_attributes` of every node (other attributes
+    set on nodes are not copied) without recursion.  Values which are
+    neither nodes nor lists are shared.
+
+    If share_leaves is True contexts, operators and constants are shared
+    with tree instead of copied.
+
+    substitute maps id(node) of nodes in tree to a replacement, the copy
+    will contain a clone of the replacement in place of the node.
+    """
+    if share_leaves:
+        shared = _FIELDLESS + _CONSTANTS
+    else:
+        shared = ()
+
+    if substitute is None:
+        substitute = {}
+
+    def _new(value):
+        try:
+            value = substitute[id(value)]
+        except KeyError:
+            pass
+
+        if isinstance(value, ast.AST):
+            if isinstance(value, shared):
+                return value
+            new = type(value).__new__(type(value))
+            todo.append((value, new))
+            return new
+        elif isinstance(value, list):
+            new = []
+            todo.append((value, new))
+            return new
+        return value
+
+    todo = []
+    root = _new(tree)
+    while todo:
+        src, dst = todo.pop()
+        if isinstance(src, list):
+            dst.extend(map(_new, src))
+            continue
+
+        for field in _clone_fields(type(src)):
+            try:
+                value = getattr(src, field)
+            except AttributeError:
+                continue
+            setattr(dst, field, _new(value))
+    return root
@@ -1,6 +1,18 @@
+import ast
+import typing as tp
+
+
 class unroll:
-    def __init__(self, _iter):
+    '''
+    Marks a for loop to be unrolled by loop_unroll.  If factor is given the
+    body is only replicated factor times, in a loop over groups of values
+    followed by a loop over the remainder.
+    '''
+    def __init__(self, _iter, factor=None):
+        if factor is not None and factor < 1:
+            raise ValueError('factor must be positive')
         self._iter = _iter
+        self.factor = factor
 
     def __iter__(self):
         return iter(self._iter)
@@ -10,5 +22,174 @@ class inline:
         self._cond = cond
 
     def __bool__(self):
-        return self._cond
+        return bool(self._cond)
+
+
+# macro type -> node type -> (field, expand)
+_REGISTRY = {}
+
+
+def register_macro(
+        macro_type: type,
+        node_type: tp.Type[ast.AST],
+        field: str) -> tp.Callable:
+    '''
+    Decorator which registers expand as the expansion of node_type nodes
+    whose field evaluates to an instance of macro_type (see expand_macros):
+        expand(node, macro, env, root) -> replacement
+    where the replacement is a node, a list of nodes or None to delete node.
+    '''
+    def wrapper(expand: tp.Callable) -> tp.Callable:
+        _REGISTRY.setdefault(macro_type, {})[node_type] = field, expand
+        return expand
+    return wrapper
+
+
+def macro_types() -> tp.Tuple[type, ...]:
+    return tuple(_REGISTRY)
+
+
+def get_expansion(
+        macro: tp.Any,
+        node_type: tp.Type[ast.AST]) -> tp.Optional[tp.Tuple[str, tp.Callable]]:
+    '''
+    Returns the (field, expand) registered for the most derived base of
+    type(macro) on node_type
+    '''
+    for cls in type(macro).__mro__:
+        try:
+            return _REGISTRY[cls][node_type]
+        except KeyError:
+            pass
+    return None
+
+
+def macro_fields() -> tp.Dict[tp.Type[ast.AST], tp.List[str]]:
+    '''
+    Maps each node type to its fields which may hold a macro
+    '''
+    fields = {}
+    for by_node in _REGISTRY.values():
+        for node_type, (field, _) in by_node.items():
+            node_fields = fields.setdefault(node_type, [])
+            if field not in node_fields:
+                node_fields.append(field)
+    return fields
+
+
+_MISSING = object()
+
+
+_CODE_CACHE = {}
+_CODE_CACHE_SIZE = 1024
+
+
+def _global_names(code) -> tp.FrozenSet[str]:
+    '''
+    Names code (and any comprehension or lambda in it) may load as globals
+    '''
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            names |= _global_names(const)
+    return frozenset(names)
+
+
+def _compile_expr(tree: ast.expr):
+    '''
+    Returns the code for tree and the global names it uses, cached by the
+    structure of tree
+    '''
+    key = ast.dump(tree)
+    try:
+        return _CODE_CACHE[key]
+    except KeyError:
+        pass
+    if len(_CODE_CACHE) >= _CODE_CACHE_SIZE:
+        _CODE_CACHE.clear()
+    expr = ast.fix_missing_locations(ast.Expression(body=tree))
+    code = compile(expr, '<macro>', 'eval')
+    entry = _CODE_CACHE[key] = code, _global_names(code)
+    return entry
+
+
+def _chain(node: ast.expr) -> tp.Optional[tp.List[str]]:
+    '''
+    Returns [name, attr, attr, ...] if node is a dotted name else None
+    '''
+    attrs = []
+    while isinstance(node, ast.Attribute):
+        attrs.append(node.attr)
+        node = node.value
+    if isinstance(node, ast.Name):
+        attrs.append(node.id)
+        return attrs[::-1]
+    return None
+
+
+class MacroEvaluator:
+    '''
+    Evaluates the expressions which may be macros, e.g. the iter of a for
+    loop or the test of an if, at compile time.
+
+    Only dotted names and calls to dotted names which resolve to one of
+    `macro_types` are evaluated, anything else is not a macro and is
+    rejected without evaluating it.  Calls are compiled directly from the
+    AST (the code is cached per expression) and run against only the names
+    they use, each of which is looked up in env once per evaluator.
+    '''
+    def __init__(self,
+            env: tp.Mapping[str, tp.Any],
+            macro_types: tp.Tuple[type, ...] = (unroll, inline)):
+        self.env = env
+        self.macro_types = macro_types
+        self._names = {}
+
+    def _lookup(self, name: str) -> tp.Any:
+        try:
+            return self._names[name]
+        except KeyError:
+            pass
+        value = self.env.get(name, _MISSING)
+        self._names[name] = value
+        return value
+
+    def _resolve(self, chain: tp.List[str]) -> tp.Any:
+        value = self._lookup(chain[0])
+        for attr in chain[1:]:
+            if value is _MISSING:
+                break
+            value = getattr(value, attr, _MISSING)
+        return value
+
+    def __call__(self, node: ast.expr) -> tp.Optional[tp.Any]:
+        '''
+        Returns the macro node evaluates to or None if it is not a macro
+        '''
+        if isinstance(node, ast.Call):
+            chain = _chain(node.func)
+            if chain is None:
+                return None
+            func = self._resolve(chain)
+            if not (isinstance(func, type) and issubclass(func, self.macro_types)):
+                return None
+
+            code, global_names = _compile_expr(node)
+            names = {}
+            for name in global_names:
+                value = self._lookup(name)
+                if value is not _MISSING:
+                    names[name] = value
+            try:
+                value = eval(code, names)
+            except Exception:
+                return None
+        else:
+            chain = _chain(node)
+            if chain is None:
+                return None
+            value = self._resolve(chain)
 
+        if isinstance(value, self.macro_types):
+            return value
+        return None
@@ -1,9 +1,13 @@
 from .base import * # This MUST be first
 
 from .bool_to_bit import *
+from .constant_fold import *
+from .cse import *
 from .debug import *
 from .if_to_phi import *
 from .ssa import *
+from .ssa_cleanup import *
 from .util import *
 from .loop_unroll import loop_unroll
 from .if_inline import if_inline
+from .expand_macros import expand_macros
@@ -0,0 +1,317 @@
+import ast
+import operator
+import typing as tp
+
+from . import Pass
+from . import PASS_ARGS_T
+from .ssa_cleanup import _NameCounter
+
+from ast_tools.stack import SymbolTable
+
+__ALL__ = ['constant_fold']
+
+# Only values of exactly these types are folded so that no user defined
+# operator overloads are ever called
+_SAFE_TYPES = frozenset((bool, int, float, complex, str, bytes, type(None)))
+
+# Limits on the size of folded values, so that folding x = 2 ** 10 ** 10
+# or 'a' * 10 ** 10 does not hang the pass or blow up the output
+_MAX_INT_BITS = 128
+_MAX_SIZE = 4096
+
+_BIN_OPS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.LShift: operator.lshift,
+    ast.RShift: operator.rshift,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.BitAnd: operator.and_,
+}
+
+_UNARY_OPS = {
+    ast.UAdd: operator.pos,
+    ast.USub: operator.neg,
+    ast.Invert: operator.invert,
+    ast.Not: operator.not_,
+}
+
+_CMP_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.In: lambda a, b: a in b,
+    ast.NotIn: lambda a, b: a not in b,
+}
+
+
+def _constant(node: ast.expr) -> tp.Tuple[bool, tp.Any]:
+    '''
+    Returns (True, value) if node is a literal constant else (False, None)
+    '''
+    if isinstance(node, ast.Constant):
+        return True, node.value
+    elif isinstance(node, ast.Num):
+        return True, node.n
+    elif isinstance(node, (ast.Str, ast.Bytes)):
+        return True, node.s
+    elif isinstance(node, ast.NameConstant):
+        return True, node.value
+    return False, None
+
+
+def _safe_constant(node: ast.expr) -> tp.Tuple[bool, tp.Any]:
+    is_const, value = _constant(node)
+    if is_const and type(value) in _SAFE_TYPES:
+        return True, value
+    return False, None
+
+
+def _check_size(op: type, left: tp.Any, right: tp.Any) -> bool:
+    '''
+    Conservatively check that computing op(left, right) is cheap
+    '''
+    if op is ast.Pow:
+        if isinstance(left, int) and isinstance(right, int) and right > 0:
+            return left.bit_length() * right <= _MAX_INT_BITS
+    elif op is ast.LShift:
+        if isinstance(left, int) and isinstance(right, int):
+            return 0 <= right <= _MAX_INT_BITS \
+                    and left.bit_length() + right <= _MAX_INT_BITS
+    elif op is ast.Mult:
+        for seq, n in ((left, right), (right, left)):
+            if isinstance(seq, (str, bytes)) and isinstance(n, int):
+                return len(seq) * n <= _MAX_SIZE
+    elif op is ast.Mod:
+        # printf style formatting can produce arbitrarily large strings
+        return not isinstance(left, (str, bytes))
+    elif op is ast.Add:
+        if isinstance(left, (str, bytes)) and isinstance(right, (str, bytes)):
+            return len(left) + len(right) <= _MAX_SIZE
+    return True
+
+
+def _make_constant(value: tp.Any, node: ast.AST) -> ast.expr:
+    return ast.copy_location(ast.Constant(value=value), node)
+
+
+_DEFS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda)
+
+
+def _scope_effects(stmts: tp.Sequence[ast.stmt]) -> tp.Tuple[bool, tp.Set[str]]:
+    '''
+    Returns (pinned, bound) for stmts: pinned is True if they contain a
+    yield, await, global or nonlocal of the enclosing function, which
+    affect it even if they are never executed, and bound are the names
+    they bind, which are locals of the enclosing function for the same
+    reason.  Nested scopes are skipped except for the names they define
+    and the parts of them evaluated in the enclosing scope.
+    '''
+    bound = set()
+    todo = list(stmts)
+    while todo:
+        node = todo.pop()
+        if isinstance(node, (ast.Yield, ast.YieldFrom, ast.Await,
+                             ast.Global, ast.Nonlocal)):
+            return True, bound
+        elif isinstance(node, _DEFS):
+            if not isinstance(node, ast.Lambda):
+                bound.add(node.name)
+            todo.extend(getattr(node, 'decorator_list', ()))
+            todo.extend(getattr(node, 'bases', ()))
+            todo.extend(getattr(node, 'keywords', ()))
+            args = getattr(node, 'args', None)
+            if args is not None:
+                todo.extend(args.defaults)
+                todo.extend(c for c in args.kw_defaults if c is not None)
+            continue
+        elif isinstance(node, ast.Name):
+            if not isinstance(node.ctx, ast.Load):
+                bound.add(node.id)
+        elif isinstance(node, ast.alias):
+            if node.name != '*':
+                bound.add(node.asname or node.name.split('.')[0])
+        elif isinstance(node, ast.ExceptHandler):
+            if node.name is not None:
+                bound.add(node.name)
+        todo.extend(ast.iter_child_nodes(node))
+    return False, bound
+
+
+class ConstantFolder(ast.NodeTransformer):
+    '''
+    Folds operations over constants bottom up.  Loads of names in
+    `constants` are replaced by the constant they are bound to.
+    '''
+    def __init__(self, constants: tp.Optional[tp.Mapping[str, tp.Any]] = None):
+        if constants is None:
+            constants = {}
+        self.constants = constants
+
+    def visit_Name(self, node: ast.Name) -> ast.expr:
+        if isinstance(node.ctx, ast.Load) and node.id in self.constants:
+            return _make_constant(self.constants[node.id], node)
+        return node
+
+    def visit_BinOp(self, node: ast.BinOp) -> ast.expr:
+        node = self.generic_visit(node)
+        l_const, left = _safe_constant(node.left)
+        r_const, right = _safe_constant(node.right)
+        op = type(node.op)
+        if l_const and r_const and op in _BIN_OPS \
+                and _check_size(op, left, right):
+            try:
+                value = _BIN_OPS[op](left, right)
+            except (ArithmeticError, ValueError, TypeError):
+                return node
+            return _make_constant(value, node)
+        return node
+
+    def visit_UnaryOp(self, node: ast.UnaryOp) -> ast.expr:
+        node = self.generic_visit(node)
+        is_const, operand = _safe_constant(node.operand)
+        op = type(node.op)
+        if is_const and op in _UNARY_OPS:
+            try:
+                value = _UNARY_OPS[op](operand)
+            except (ArithmeticError, ValueError, TypeError):
+                return node
+            return _make_constant(value, node)
+        return node
+
+    def visit_Compare(self, node: ast.Compare) -> ast.expr:
+        node = self.generic_visit(node)
+        is_const, left = _safe_constant(node.left)
+        if not is_const:
+            return node
+
+        for op, comparator in zip(node.ops, node.comparators):
+            is_const, right = _safe_constant(comparator)
+            if not is_const or type(op) not in _CMP_OPS:
+                return node
+            try:
+                result = _CMP_OPS[type(op)](left, right)
+            except (ArithmeticError, ValueError, TypeError):
+                return node
+            if not result:
+                return _make_constant(False, node)
+            left = right
+        return _make_constant(True, node)
+
+    def visit_BoolOp(self, node: ast.BoolOp) -> ast.expr:
+        node = self.generic_visit(node)
+        is_and = isinstance(node.op, ast.And)
+        # Leading constants either short circuit or can be dropped
+        values = list(node.values)
+        while values:
+            is_const, value = _safe_constant(values[0])
+            if not is_const:
+                break
+            elif len(values) == 1 or bool(value) != is_and:
+                return values[0]
+            values.pop(0)
+
+        if len(values) == 1:
+            return values[0]
+        node.values = values
+        return node
+
+    def visit_IfExp(self, node: ast.IfExp) -> ast.expr:
+        node = self.generic_visit(node)
+        is_const, test = _safe_constant(node.test)
+        if is_const:
+            return node.body if test else node.orelse
+        return node
+
+    def visit_If(self, node: ast.If) -> tp.Union[ast.If, tp.List[ast.stmt]]:
+        node = self.generic_visit(node)
+        is_const, test = _safe_constant(node.test)
+        if is_const:
+            live, dead = (node.body, node.orelse) if test else (node.orelse, node.body)
+            # Dropping the dead branch must not change the enclosing
+            # function, e.g. `if False: yield` makes it a generator and
+            # names assigned only in the dead branch are still locals
+            pinned, bound = _scope_effects(dead)
+            if pinned or bound - _scope_effects(live)[1]:
+                return node
+            return live or [ast.Pass()]
+        return node
+
+
+def _single_assignments(tree: ast.FunctionDef) -> tp.Set[str]:
+    '''
+    Names which are assigned exactly once in tree and are not used in a
+    nested scope, declared global / nonlocal or parameters.
+    '''
+    counter = _NameCounter()
+    for stmt in tree.body:
+        counter.visit(stmt)
+    params = {a.arg for a in ast.walk(tree.args) if isinstance(a, ast.arg)}
+    return {
+        name for name, n in counter.stores.items()
+        if n == 1 and name not in counter.pinned and name not in params
+    }
+
+
+class constant_fold(Pass):
+    '''
+    Pass to fold operations on constants, e.g. the output of loop_unroll:
+    ```
+    x[0 + 1] = 2 * 3 if True else y
+    ```
+    becomes:
+    ```
+    x[1] = 6
+    ```
+    Only arithmetic, comparisons, boolean operators and conditionals over
+    constants of builtin types are folded, so user code is never called.
+    Folds which would produce very large values are skipped.
+
+    arguments:
+        propagate: bool
+            If propagate is True (default) and the tree is a function, names
+            assigned a constant exactly once by a top level statement (as in
+            the output of ssa) are replaced by the constant in the statements
+            which follow the assignment.  The assignment itself is kept (see
+            ssa_cleanup).
+    '''
+    def __init__(self, propagate: bool = True):
+        self.propagate = propagate
+
+    def rewrite(self,
+            tree: ast.AST,
+            env: SymbolTable,
+            metadata: tp.MutableMapping) -> PASS_ARGS_T:
+        if not (self.propagate and isinstance(tree, ast.FunctionDef)):
+            return ConstantFolder().visit(tree), env, metadata
+
+        candidates = _single_assignments(tree)
+        folder = ConstantFolder({})
+        body = []
+        for stmt in tree.body:
+            stmt = folder.visit(stmt)
+            if stmt is None:
+                continue
+            elif not isinstance(stmt, ast.AST):
+                body.extend(stmt)
+                continue
+
+            if isinstance(stmt, ast.Assign) \
+                    and len(stmt.targets) == 1 \
+                    and isinstance(stmt.targets[0], ast.Name) \
+                    and stmt.targets[0].id in candidates:
+                is_const, value = _safe_constant(stmt.value)
+                if is_const:
+                    folder.constants[stmt.targets[0].id] = value
+            body.append(stmt)
+
+        tree.body = body or [ast.Pass()]
+        return tree, env, metadata
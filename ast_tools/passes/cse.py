@@ -0,0 +1,323 @@
+import ast
+from collections import Counter
+import typing as tp
+
+from . import Pass
+from . import PASS_ARGS_T
+from .constant_fold import _constant
+from .ssa_cleanup import _NameCounter
+
+from ast_tools.common import gen_free_prefix
+from ast_tools.stack import SymbolTable
+
+__ALL__ = ['cse']
+
+# Statements which do not contain control flow
+_SIMPLE_STMTS = (ast.Assign, ast.AugAssign, ast.AnnAssign, ast.Expr, ast.Return, ast.Pass)
+
+# Expressions which can't be bound to a name
+_LEAVES = (
+    ast.Name, ast.Constant, ast.Num, ast.Str, ast.Bytes, ast.NameConstant,
+    ast.Index, ast.Slice,
+)
+
+_NAMED_EXPR = getattr(ast, 'NamedExpr', ())
+
+_SIDE_EFFECTS = tuple(
+    getattr(ast, name)
+    for name in ('Call', 'Await', 'Yield', 'YieldFrom', 'NamedExpr')
+    if hasattr(ast, name)
+)
+
+
+class _ValueNumbering(ast.NodeVisitor):
+    '''
+    Assigns a value number to every pure expression of a statement.
+
+    Names local to the function are numbered by their version, which is
+    bumped whenever they are stored to.  Anything which reads memory that
+    a call could modify (attributes, subscripts and non local names) is
+    numbered by the current epoch, which is bumped after each statement
+    with side effects.
+    '''
+    def __init__(self, locals: tp.AbstractSet[str]):
+        self.locals = locals
+        self.versions = Counter()
+        self.epoch = 0
+        self.table = {}
+        # id(node) -> (value number, reads memory)
+        self.numbers = {}
+
+    def number(self, node: ast.AST, key: tp.Tuple, reads_memory: bool):
+        vn = self.table.setdefault(key, len(self.table))
+        self.numbers[id(node)] = vn, reads_memory
+
+    def _children(self, node, *children) -> tp.Optional[tp.Tuple[tp.Tuple, bool]]:
+        vns = []
+        reads_memory = False
+        for child in children:
+            if child is not None:
+                self.visit(child)
+
+        for child in children:
+            if child is None:
+                vns.append(None)
+                continue
+            try:
+                vn, mem = self.numbers[id(child)]
+            except KeyError:
+                return None
+            vns.append(vn)
+            reads_memory |= mem
+        return tuple(vns), reads_memory
+
+    def _visit_op(self, node: ast.AST, key: tp.Tuple, *children):
+        r = self._children(node, *children)
+        if r is not None:
+            vns, reads_memory = r
+            self.number(node, key + vns, reads_memory)
+
+    def visit_Name(self, node: ast.Name):
+        if not isinstance(node.ctx, ast.Load):
+            return
+        elif node.id in self.locals:
+            self.number(node, ('Name', node.id, self.versions[node.id]), False)
+        else:
+            self.number(node, ('Name', node.id, self.epoch), True)
+
+    def _visit_constant(self, node: ast.expr):
+        # Key on repr so that e.g. 0.0 and -0.0 are distinct
+        _, value = _constant(node)
+        self.number(node, ('Constant', type(value), repr(value)), False)
+
+    visit_Constant = visit_Num = visit_Str = visit_Bytes = visit_NameConstant = _visit_constant
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if not isinstance(node.ctx, ast.Load):
+            return self.generic_visit(node)
+        r = self._children(node, node.value)
+        if r is not None:
+            self.number(node, ('Attribute', node.attr, self.epoch) + r[0], True)
+
+    def visit_Subscript(self, node: ast.Subscript):
+        if not isinstance(node.ctx, ast.Load):
+            return self.generic_visit(node)
+        r = self._children(node, node.value, node.slice)
+        if r is not None:
+            self.number(node, ('Subscript', self.epoch) + r[0], True)
+
+    def visit_Index(self, node):
+        self._visit_op(node, ('Index',), node.value)
+
+    def visit_Slice(self, node: ast.Slice):
+        self._visit_op(node, ('Slice',), node.lower, node.upper, node.step)
+
+    def visit_Tuple(self, node: ast.Tuple):
+        if not isinstance(node.ctx, ast.Load):
+            return self.generic_visit(node)
+        self._visit_op(node, ('Tuple',), *node.elts)
+
+    def visit_BinOp(self, node: ast.BinOp):
+        self._visit_op(node, ('BinOp', type(node.op)), node.left, node.right)
+
+    def visit_UnaryOp(self, node: ast.UnaryOp):
+        self._visit_op(node, ('UnaryOp', type(node.op)), node.operand)
+
+    def visit_BoolOp(self, node: ast.BoolOp):
+        self._visit_op(node, ('BoolOp', type(node.op)), *node.values)
+
+    def visit_Compare(self, node: ast.Compare):
+        ops = tuple(map(type, node.ops))
+        self._visit_op(node, ('Compare', ops), node.left, *node.comparators)
+
+    def visit_IfExp(self, node: ast.IfExp):
+        self._visit_op(node, ('IfExp',), node.test, node.body, node.orelse)
+
+    def generic_visit(self, node: ast.AST):
+        # Don't number inside of nested scopes as names may be shadowed
+        if isinstance(node, (ast.Lambda, ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            return
+        super().generic_visit(node)
+
+
+def _conditional_children(node: ast.AST) -> tp.Container[ast.AST]:
+    '''
+    Children of node which are not always evaluated when node is
+    '''
+    if isinstance(node, ast.IfExp):
+        return (node.body, node.orelse)
+    elif isinstance(node, ast.BoolOp):
+        return node.values[1:]
+    return ()
+
+
+class _Rewriter(ast.NodeTransformer):
+    '''
+    Replaces repeated expressions with names, emitting the binding of each
+    name before the statement containing its first occurrence.
+    '''
+    def __init__(self,
+            numbering: _ValueNumbering,
+            counts: tp.Mapping[int, int],
+            prefix: str):
+        self.numbering = numbering
+        self.counts = counts
+        self.prefix = prefix
+        self.bound = {}
+        self.bindings = []
+
+    def visit(self, node: ast.AST, bound_only: bool = False) -> ast.AST:
+        '''
+        If bound_only is True node is conditionally evaluated so only
+        expressions which have already been bound are replaced
+        '''
+        try:
+            vn, _ = self.numbering.numbers[id(node)]
+        except KeyError:
+            vn = None
+
+        if vn in self.bound:
+            return ast.Name(self.bound[vn], ast.Load())
+        elif vn is not None and self.counts[vn] > 1 and not bound_only:
+            node = self._visit_children(node, bound_only)
+            name = self.bound[vn] = self.prefix + str(len(self.bound))
+            self.bindings.append(ast.Assign(
+                targets=[ast.Name(name, ast.Store())],
+                value=node,
+            ))
+            return ast.Name(name, ast.Load())
+        return self._visit_children(node, bound_only)
+
+    def _visit_children(self, node: ast.AST, bound_only: bool) -> ast.AST:
+        skip = _conditional_children(node)
+        for field, old_value in ast.iter_fields(node):
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, ast.AST):
+                        value = self.visit(value,
+                                bound_only or any(value is s for s in skip))
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, ast.AST):
+                setattr(node, field, self.visit(old_value,
+                        bound_only or any(old_value is s for s in skip)))
+        return node
+
+
+class cse(Pass):
+    '''
+    Pass to perform common subexpression elimination on straight-line code,
+    such as the output of ssa. e.g.:
+    ```
+    x0 = a.b + c
+    x1 = a.b + c + 1
+    __return_value0 = x0 * (a.b + c) if cond else x1
+    ```
+    becomes:
+    ```
+    __cse0 = a.b + c
+    x0 = __cse0
+    x1 = __cse0 + 1
+    __return_value0 = x0 * __cse0 if cond else x1
+    ```
+    Pure expressions (operators, attribute and subscript reads) are value
+    numbered by structure.  Reads of attributes, subscripts and non-local
+    names are not shared across statements with side effects (calls).
+    Compound statements are not rewritten and act as barriers.
+    Subexpressions which are only conditionally evaluated (the arms of
+    `if` expressions and all but the first operand of `and` / `or`) are
+    never hoisted, but do reuse values which are computed unconditionally.
+
+    arguments:
+        prefix: str
+            Controls the names the expressions are bound to. Has no
+            functional effects as the pass will only ever use free names.
+    '''
+    def __init__(self, prefix: str = '__cse'):
+        self.prefix = prefix
+
+    def rewrite(self,
+            tree: ast.AST,
+            env: SymbolTable,
+            metadata: tp.MutableMapping) -> PASS_ARGS_T:
+        if not isinstance(tree, ast.FunctionDef):
+            raise TypeError('cse should only be applied to functions')
+
+        counter = _NameCounter()
+        for stmt in tree.body:
+            counter.visit(stmt)
+        params = {a.arg for a in ast.walk(tree.args) if isinstance(a, ast.arg)}
+        locals = (params | counter.stores.keys()) - counter.pinned
+
+        # Number every statement, count each repeated expression only once
+        # per occurrence of its outermost repeat
+        numbering = _ValueNumbering(locals)
+        counts = Counter()
+        for stmt in tree.body:
+            if not isinstance(stmt, _SIMPLE_STMTS):
+                for node in ast.walk(stmt):
+                    if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+                        numbering.versions[node.id] += 1
+                numbering.epoch += 1
+                continue
+
+            numbering.visit(stmt)
+            side_effects = any(
+                isinstance(node, _SIDE_EFFECTS)
+                or (isinstance(node, (ast.Attribute, ast.Subscript))
+                    and not isinstance(node.ctx, ast.Load))
+                for node in ast.walk(stmt))
+
+            # A call in the statement may change memory before or after
+            # any given read so none of them can be shared
+            if side_effects:
+                for node in ast.walk(stmt):
+                    entry = numbering.numbers.get(id(node))
+                    if entry is not None and entry[1]:
+                        del numbering.numbers[id(node)]
+
+            # Names assigned by := have a different value after the
+            # assignment, so nothing reading them can be shared either
+            targets = {
+                node.target.id for node in ast.walk(stmt)
+                if isinstance(node, _NAMED_EXPR)
+            }
+            if targets:
+                for node in ast.walk(stmt):
+                    if id(node) in numbering.numbers and any(
+                            isinstance(n, ast.Name) and n.id in targets
+                            for n in ast.walk(node)):
+                        del numbering.numbers[id(node)]
+
+            todo = [stmt]
+            while todo:
+                node = todo.pop()
+                entry = numbering.numbers.get(id(node))
+                if entry is not None and not isinstance(node, _LEAVES):
+                    vn, _ = entry
+                    counts[vn] += 1
+                    if counts[vn] > 1:
+                        continue
+                skip = _conditional_children(node)
+                todo.extend(
+                    c for c in ast.iter_child_nodes(node)
+                    if not any(c is s for s in skip))
+
+            for node in ast.walk(stmt):
+                if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+                    numbering.versions[node.id] += 1
+            if side_effects:
+                numbering.epoch += 1
+
+        prefix = gen_free_prefix(tree, env, self.prefix)
+        rewriter = _Rewriter(numbering, counts, prefix)
+        body = []
+        for stmt in tree.body:
+            if isinstance(stmt, _SIMPLE_STMTS):
+                stmt = rewriter.visit(stmt)
+                body.extend(rewriter.bindings)
+                rewriter.bindings = []
+            body.append(stmt)
+        tree.body = body
+        return tree, env, metadata
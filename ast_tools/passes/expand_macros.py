@@ -0,0 +1,19 @@
+import ast
+import typing as tp
+
+from ast_tools.stack import SymbolTable
+from . import Pass, PASS_ARGS_T
+from ast_tools.transformers.macro_expander import expand_macros as _expand_macros
+
+
+class expand_macros(Pass):
+    '''
+    Pass to expand every registered macro (unroll, inline and any
+    registered with ast_tools.macros.register_macro) in one traversal.
+    Subsumes chaining loop_unroll and if_inline.
+    '''
+    def rewrite(self,
+                tree: ast.AST,
+                env: SymbolTable,
+                metadata: tp.MutableMapping) -> PASS_ARGS_T:
+        return _expand_macros(tree, env), env, metadata
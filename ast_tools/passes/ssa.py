@@ -1,42 +1,65 @@
 import ast
 from collections import ChainMap, Counter
-from copy import deepcopy
 import typing as tp
 
 from . import Pass
 from . import PASS_ARGS_T
-from ast_tools.common import gen_free_prefix, gen_free_name, is_free_name
-from ast_tools.immutable_ast import immutable, mutable
+from .constant_fold import _constant
+from .ssa_cleanup import ssa_cleanup
+from ast_tools.common import clone, gen_free_prefix, gen_free_name, is_free_name
 from ast_tools.stack import SymbolTable
 from ast_tools.transformers import Renamer
 from ast_tools.transformers.node_replacer import NodeReplacer
 from ast_tools.visitors import collect_targets
+from ast_tools.visitors.dispatch import DispatchTransformer
 
 __ALL__ = ['ssa']
 
+def _attr_key(node: ast.AST) -> tp.Optional[tp.Tuple[str, ...]]:
+    '''
+    Structural key of an attribute chain, e.g. `a.b.c` -> ('a', 'b', 'c').
+    None if node is not an attribute chain rooted at a Name.
+    '''
+    if not isinstance(node, ast.Attribute):
+        return None
+    key = []
+    while isinstance(node, ast.Attribute):
+        key.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    key.append(node.id)
+    return tuple(reversed(key))
+
+
 class AttrReplacer(NodeReplacer):
+    '''
+    Replaces loads and stores of attribute chains with Names.
+    The replacement takes the ctx of the node it replaces.
+    '''
     def _get_key(self, node):
-        if isinstance(node, ast.Attribute):
-            # Need the immutable value so its comparable
-            return immutable(node)
+        if isinstance(node, ast.Attribute) and not isinstance(node.ctx, ast.Del):
+            return _attr_key(node)
         else:
             return None
 
-def _flip_ctx(node):
-    node = deepcopy(node)
-    if isinstance(node.ctx, ast.Store):
-        node.ctx = ast.Load()
-    else:
-        assert isinstance(node.ctx, ast.Load)
-        node.ctx = ast.Store()
-    return node
+    def visit(self, node):
+        key = self._get_key(node)
+        try:
+            name = self.node_table[key]
+        except KeyError:
+            return DispatchTransformer.visit(self, node)
+        return ast.copy_location(ast.Name(id=name.id, ctx=node.ctx), node)
 
 class SSATransformer(ast.NodeTransformer):
     def __init__(self,
             env: SymbolTable,
             return_value_prefix: str,
+            cond_prefix: str,
             attr_names: tp.Sequence[str],
-            strict: bool):
+            strict: bool,
+            balance: bool = False,
+            lookup: bool = False):
         self.attr_names = attr_names
         self.attr_states = {name: [] for name in attr_names}
         self.env = env
@@ -44,9 +67,14 @@ class SSATransformer(ast.NodeTransformer):
         self.name_table = ChainMap()
         self.root = None
         self.cond_stack = []
+        self.path_stack = []
+        self.cond_prefix = cond_prefix
         self.return_value_prefix = return_value_prefix
         self.returns = []
         self.strict = strict
+        self.balance = balance
+        self.lookup = lookup
+        self.any_table = {}
 
 
     def _make_name(self, name):
@@ -64,7 +92,54 @@ class SSATransformer(ast.NodeTransformer):
         p = self.return_value_prefix
         name = p + str(self.name_idx[p])
         self.name_idx[p] += 1
-        return ast.Name(name, ast.Load())
+        return name
+
+
+    def _make_cond(self):
+        p = self.cond_prefix
+        name = p + str(self.name_idx[p])
+        self.name_idx[p] += 1
+        return name
+
+
+    def _push_cond(self, cond: ast.expr):
+        self.cond_stack.append(cond)
+        self.path_stack.append(None)
+
+
+    def _pop_cond(self):
+        self.path_stack.pop()
+        return self.cond_stack.pop()
+
+
+    def _path_condition(self) -> tp.Tuple[tp.List[ast.stmt], tp.Optional[ast.expr]]:
+        '''
+        Build the condition under which the current point is reached.
+
+        Each prefix of the condition stack is materialized into a
+        temporary the first time it is needed, and shared by every
+        later return in the same branch.  Returns the assignments which
+        must be emitted before the condition is used and the condition
+        (None if the point is reached unconditionally).
+        '''
+        suite = []
+        path = None
+        for idx, cond in enumerate(self.cond_stack):
+            if self.path_stack[idx] is None:
+                if path is None:
+                    self.path_stack[idx] = cond
+                else:
+                    name = self._make_cond()
+                    suite.append(ast.Assign(
+                        targets=[ast.Name(name, ast.Store())],
+                        value=ast.BoolOp(
+                            op=ast.And(),
+                            values=[clone(path), clone(cond)],
+                        ),
+                    ))
+                    self.path_stack[idx] = ast.Name(name, ast.Load())
+            path = self.path_stack[idx]
+        return suite, path
 
 
     def visit(self, node: ast.AST) -> ast.AST:
@@ -95,29 +170,206 @@ class SSATransformer(ast.NodeTransformer):
         return node
 
 
+    def _hoist_test(self, test: ast.expr, suite: tp.List[ast.stmt]) -> ast.Name:
+        # Hoist the test into a temporary so that the muxes and folded
+        # conditions only ever refer to it by name
+        if not isinstance(test, ast.Name):
+            cond = self._make_cond()
+            suite.append(ast.Assign(
+                targets=[ast.Name(cond, ast.Store())],
+                value=test,
+            ))
+            test = ast.Name(cond, ast.Load())
+        return test
+
+
+    def _visit_suite(self, body: tp.Sequence[ast.stmt], suite: tp.List[ast.stmt]):
+        for child in body:
+            child = self.visit(child)
+            if child is None:
+                continue
+            elif isinstance(child, tp.Sequence):
+                suite.extend(child)
+            else:
+                suite.append(child)
+
+
+    def _any(self,
+            conds: tp.Sequence[str],
+            suite: tp.List[ast.stmt]) -> ast.Name:
+        '''
+        Name which holds the disjunction of conds, built as a balanced
+        tree of temporaries.  Temporaries are shared between every mux
+        over the same conditions.
+        '''
+        if len(conds) == 1:
+            return ast.Name(conds[0], ast.Load())
+
+        key = tuple(conds)
+        try:
+            return ast.Name(self.any_table[key], ast.Load())
+        except KeyError:
+            pass
+
+        mid = len(conds) // 2
+        left = self._any(conds[:mid], suite)
+        right = self._any(conds[mid:], suite)
+        name = self.any_table[key] = self._make_cond()
+        suite.append(ast.Assign(
+            targets=[ast.Name(name, ast.Store())],
+            value=ast.BoolOp(op=ast.Or(), values=[left, right]),
+        ))
+        return ast.Name(name, ast.Load())
+
+
+    def _balanced_mux(self,
+            seq: tp.Sequence[tp.Tuple[tp.Optional[str], ast.expr]],
+            suite: tp.List[ast.stmt]) -> ast.expr:
+        '''
+        Select the first expr in seq whose condition holds as a mux tree
+        of depth log(len(seq)).  The condition of the last element is
+        never checked.
+        '''
+        if len(seq) == 1:
+            return seq[0][1]
+        mid = len(seq) // 2
+        return ast.IfExp(
+            test=self._any([c for c, _ in seq[:mid]], suite),
+            body=self._balanced_mux(seq[:mid], suite),
+            orelse=self._balanced_mux(seq[mid:], suite),
+        )
+
+
+    def _fold(self,
+            condition_seq: tp.Sequence[tp.Tuple[tp.Optional[ast.expr], ast.expr]],
+            ) -> tp.Tuple[tp.List[ast.stmt], ast.expr]:
+        if not self.balance:
+            return [], _fold_conditions(condition_seq)
+
+        seq = []
+        suite = []
+        for cond, expr in condition_seq:
+            if cond is not None and not isinstance(cond, ast.Name):
+                cond = self._hoist_test(cond, suite)
+            seq.append((cond, expr))
+            if cond is None:
+                break
+        seq = [(None if c is None else c.id, e) for c, e in seq]
+        return suite, self._balanced_mux(seq, suite)
+
+
+    def _visit_chain(self, node: ast.If) -> tp.List[ast.stmt]:
+        '''
+        Visit an if/elif chain without recursing through the orelse and
+        mux every name once over all of the branches.
+        '''
+        nt = self.name_table
+        suite = []
+        subjects = set()
+        keys = set()
+        arms = []
+        n_tests = 0
+        pushed = 0
+        while True:
+            test = self.visit(node.test)
+            subject, key = _match_key(test)
+            subjects.add(subject)
+            keys.add(key)
+            n_tests += 1
+            test = self._hoist_test(test, suite)
+            returns = _always_returns(node.body)
+
+            self.name_table = b_nt = nt.new_child()
+            self._push_cond(test)
+            self._visit_suite(node.body, suite)
+            self._pop_cond()
+            # The next test is only reached when this branch is not taken
+            self.name_table = nt
+            if not returns:
+                arms.append((test.id, key, b_nt.maps[0]))
+
+            # See visit_If for why the not condition is only needed
+            # when the branch falls through
+            if not returns:
+                self._push_cond(ast.UnaryOp(ast.Not(), ast.Name(test.id, ast.Load())))
+                pushed += 1
+
+            if len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+                node = node.orelse[0]
+            else:
+                break
+
+        self.name_table = d_nt = nt.new_child()
+        self._visit_suite(node.orelse, suite)
+        if not _always_returns(node.orelse):
+            arms.append((None, None, d_nt.maps[0]))
+
+        for _ in range(pushed):
+            self._pop_cond()
+        self.name_table = nt
+
+        # A table lookup is only valid when each test compares the same
+        # subject against a distinct constant
+        lookup = self.lookup and len(subjects) == 1 and None not in subjects \
+                and len(keys) == n_tests and None not in keys
+        if lookup:
+            subject, = subjects
+
+        names = set()
+        for _, _, b_nt in arms:
+            names |= b_nt.keys()
+
+        for name in sorted(names):
+            seq = []
+            for cond, key, b_nt in arms:
+                if name in b_nt:
+                    seq.append((cond, key, b_nt[name]))
+                elif name in nt:
+                    seq.append((cond, key, nt[name]))
+                elif self.strict:
+                    # name is not defined on all paths
+                    break
+                # else: assume the branch cannot fall through
+            else:
+                if not seq:
+                    continue
+                elif all(v == seq[0][2] for _, _, v in seq):
+                    nt[name] = seq[0][2]
+                    continue
+                elif lookup:
+                    value = _build_lookup(subject, seq)
+                else:
+                    value = self._balanced_mux(
+                            [(c, ast.Name(v, ast.Load())) for c, _, v in seq],
+                            suite)
+                suite.append(ast.Assign(
+                    targets=[ast.Name(self._make_name(name), ast.Store())],
+                    value=value,
+                ))
+
+        return suite
+
+
     def visit_If(self, node: ast.If) -> tp.List[ast.stmt]:
+        if self.balance and _chain_length(node) > 2:
+            return self._visit_chain(node)
+
         test = self.visit(node.test)
         nt = self.name_table
         suite = []
+        test = self._hoist_test(test, suite)
 
         # determine if either branch always returns
         t_returns = _always_returns(node.body)
         f_returns = _always_returns(node.orelse)
 
         self.name_table = t_nt = nt.new_child()
-        self.cond_stack.append(test)
+        self._push_cond(test)
 
         # gather nodes from the body
-        for child in node.body:
-            child = self.visit(child)
-            if child is None:
-                continue
-            elif isinstance(child, tp.Sequence):
-                suite.extend(child)
-            else:
-                suite.append(child)
+        self._visit_suite(node.body, suite)
 
-        self.cond_stack.pop()
+        self._pop_cond()
 
         # Add not condition to the stack if the true branch
         # does not always return
@@ -142,22 +394,15 @@ class SSATransformer(ast.NodeTransformer):
         # should become:
         #   return 0 if x and y else 1 if not x else 2
         if not t_returns:
-            self.cond_stack.append(ast.UnaryOp(ast.Not(), test))
+            self._push_cond(ast.UnaryOp(ast.Not(), ast.Name(test.id, ast.Load())))
 
         self.name_table = f_nt = nt.new_child()
 
         # gather nodes from the orelse
-        for child in node.orelse:
-            child = self.visit(child)
-            if child is None:
-                continue
-            elif isinstance(child, tp.Sequence):
-                suite.extend(child)
-            else:
-                suite.append(child)
+        self._visit_suite(node.orelse, suite)
 
         if not t_returns:
-            self.cond_stack.pop()
+            self._pop_cond()
         self.name_table = nt
 
         # Note by first checking for fall through conditions
@@ -217,7 +462,7 @@ class SSATransformer(ast.NodeTransformer):
                             ),
                         ],
                         value=ast.IfExp(
-                            test=test,
+                            test=_build_name(test.id),
                             body=_build_name(t_name),
                             orelse=_build_name(f_name),
                         ),
@@ -265,22 +510,24 @@ class SSATransformer(ast.NodeTransformer):
                     ctx=ctx)
 
 
-    def visit_Return(self, node: ast.Return) -> ast.Assign:
+    def visit_Return(self, node: ast.Return) -> tp.List[ast.stmt]:
+        suite, cond = self._path_condition()
+
         # Record the state of each attr_name
-        stack = list(self.cond_stack)
         for name in self.attr_names:
             self.attr_states[name].append((
-                stack,
+                clone(cond),
                 ast.Name(self.name_table[name], ast.Load())))
 
         # Record the return value
         r_val = self.visit(node.value)
         r_name = self._make_return()
-        self.returns.append((stack, r_name))
-        return ast.Assign(
+        self.returns.append((clone(cond), ast.Name(r_name, ast.Load())))
+        suite.append(ast.Assign(
             targets=[ast.Name(r_name, ast.Store())],
             value=r_val,
-        )
+        ))
+        return suite
 
 
     # don't support control flow other than if
@@ -316,45 +563,164 @@ class SSATransformer(ast.NodeTransformer):
         return renamer.visit(node)
 
 
+class _DefiniteAssignment(ast.NodeVisitor):
+    '''
+    Definite assignment dataflow over if-structured control flow.
+
+    The set of defined names at each program point is a bitset (an int)
+    indexed by name id.  A state of None means the point is unreachable
+    (every path to it has returned), which acts as the identity for the
+    meet at the end of an if.
+    '''
+    def __init__(self, env: SymbolTable, names: tp.Iterable[str]):
+        self.env = env
+        self.ids = {}
+        self.errors = []
+        self.defined = 0
+        for name in names:
+            self._define(name)
+
+    def _bit(self, name: str) -> int:
+        try:
+            return self.ids[name]
+        except KeyError:
+            pass
+        bit = self.ids[name] = 1 << len(self.ids)
+        return bit
+
+    def _define(self, name: str):
+        if self.defined is not None:
+            self.defined |= self._bit(name)
+
+    def _use(self, node: ast.AST, name: str):
+        if self.defined is None or self.defined & self._bit(name):
+            return
+        elif name in self.env or name in _builtin_names(self.env):
+            return
+        elif hasattr(node, 'lineno'):
+            self.errors.append(f'Cannot prove name, {name}, is defined at line {node.lineno}')
+        else:
+            self.errors.append(f'Cannot prove name, {name}, is defined')
+
+    def visit_body(self, body: tp.Sequence[ast.stmt]):
+        for stmt in body:
+            self.visit(stmt)
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Store):
+            self._define(node.id)
+        else:
+            self._use(node, node.id)
+            if isinstance(node.ctx, ast.Del) and self.defined is not None:
+                self.defined &= ~self._bit(node.id)
+
+    def visit_Assign(self, node: ast.Assign):
+        self.visit(node.value)
+        for target in node.targets:
+            self.visit(target)
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        self.visit(node.value)
+        if isinstance(node.target, ast.Name):
+            self._use(node.target, node.target.id)
+        self.visit(node.target)
+
+    def visit_AnnAssign(self, node: ast.AnnAssign):
+        if node.value is not None:
+            self.visit(node.value)
+            self.visit(node.target)
+
+    def visit_Return(self, node: ast.Return):
+        if node.value is not None:
+            self.visit(node.value)
+        self.defined = None
+
+    def visit_If(self, node: ast.If):
+        self.visit(node.test)
+        entry = self.defined
+        self.visit_body(node.body)
+        t_defined = self.defined
+        self.defined = entry
+        self.visit_body(node.orelse)
+        f_defined = self.defined
+        if t_defined is None:
+            self.defined = f_defined
+        elif f_defined is None:
+            self.defined = t_defined
+        else:
+            self.defined = t_defined & f_defined
+
+    # Bodies of defs and lambdas are not executed at definition time
+    # so only the parts which are evaluated in place are checked.
+    def _visit_def(self, node):
+        for deco in node.decorator_list:
+            self.visit(deco)
+        self.visit(node.args)
+        if node.returns is not None:
+            self.visit(node.returns)
+        self._define(node.name)
+
+    visit_FunctionDef = visit_AsyncFunctionDef = _visit_def
+
+    def visit_arg(self, node: ast.arg):
+        if node.annotation is not None:
+            self.visit(node.annotation)
+
+    def visit_Lambda(self, node: ast.Lambda):
+        self.visit(node.args)
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        for deco in node.decorator_list:
+            self.visit(deco)
+        for base in node.bases:
+            self.visit(base)
+        for keyword in node.keywords:
+            self.visit(keyword)
+        self._define(node.name)
+
+    # Comprehension targets are local to the comprehension
+    def _visit_comp(self, node):
+        entry = self.defined
+        for gen in node.generators:
+            self.visit(gen.iter)
+            self.visit(gen.target)
+            for cond in gen.ifs:
+                self.visit(cond)
+        if isinstance(node, ast.DictComp):
+            self.visit(node.key)
+            self.visit(node.value)
+        else:
+            self.visit(node.elt)
+        self.defined = entry
+
+    visit_ListComp = visit_SetComp = visit_GeneratorExp = visit_DictComp = _visit_comp
+
+
+def _builtin_names(env: SymbolTable) -> tp.Container[str]:
+    try:
+        builtins = env['__builtins__']
+    except KeyError:
+        return ()
+    if isinstance(builtins, tp.Mapping):
+        return builtins
+    return builtins.__dict__
+
+
 def _prove_names_defined(
         env: SymbolTable,
         names: tp.AbstractSet[str],
-        node: tp.Union[ast.AST, tp.Sequence[ast.AST]]) -> tp.AbstractSet[str]:
+        body: tp.Sequence[ast.stmt]) -> None:
     '''
     Prove that all names are defined.
     i.e. if a name is used at some point then all paths leading to that point
     must either return or define the name.
-    '''
-    names = set(names)
-    if isinstance(node, ast.Name):
-        if isinstance(node.ctx, ast.Store):
-            names.add(node.id)
-        elif node.id not in names and node.id not in env and \
-                node.id not in env["__builtins__"].__dict__:
-            if hasattr(node, 'lineno'):
-                raise SyntaxError(f'Cannot prove name, {node.id}, is defined at line {node.lineno}')
-            else:
-                raise SyntaxError(f'Cannot prove name, {node.id}, is defined')
 
-    elif isinstance(node, ast.If):
-        t_returns = _always_returns(node.body)
-        f_returns = _always_returns(node.orelse)
-        t_names = _prove_names_defined(env, names, node.body)
-        f_names = _prove_names_defined(env, names, node.orelse)
-        if not (t_returns or f_returns):
-            names |= t_names & f_names
-        elif t_returns:
-            names |= f_names
-        elif f_returns:
-            names |= t_names
-    elif isinstance(node, ast.AST):
-        for child in ast.iter_child_nodes(node):
-            names |= _prove_names_defined(env, names, child)
-    else:
-        assert isinstance(node, tp.Sequence)
-        for child in node:
-            names |= _prove_names_defined(env, names, child)
-    return names
+    Every violation is collected and reported in a single SyntaxError.
+    '''
+    analysis = _DefiniteAssignment(env, names)
+    analysis.visit_body(body)
+    if analysis.errors:
+        raise SyntaxError('\n'.join(analysis.errors))
 
 
 def _always_returns(body: tp.Sequence[ast.stmt]) -> bool:
@@ -385,21 +751,79 @@ def _never_returns(body: tp.Sequence[ast.stmt]) -> bool:
     return True
 
 
+def _build_attr(value_id: str, attr: str, ctx: ast.expr_context) -> ast.Attribute:
+    return ast.Attribute(
+        value=ast.Name(value_id, ast.Load()),
+        attr=attr,
+        ctx=ctx,
+    )
+
+
+def _chain_length(node: ast.If) -> int:
+    '''
+    Number of tests in an if/elif chain
+    '''
+    n = 1
+    while len(node.orelse) == 1 and isinstance(node.orelse[0], ast.If):
+        node = node.orelse[0]
+        n += 1
+    return n
+
+
+def _match_key(test: ast.expr) -> tp.Tuple[tp.Optional[str], tp.Any]:
+    '''
+    If test is of the form `name == constant` return (name, constant)
+    else (None, None).
+    '''
+    if isinstance(test, ast.Compare) \
+            and isinstance(test.left, ast.Name) \
+            and len(test.ops) == 1 \
+            and isinstance(test.ops[0], ast.Eq):
+        is_const, value = _constant(test.comparators[0])
+        if is_const:
+            try:
+                hash(value)
+            except TypeError:
+                return None, None
+            return test.left.id, value
+    return None, None
+
+
+def _build_lookup(
+        subject: str,
+        seq: tp.Sequence[tp.Tuple[tp.Optional[str], tp.Any, str]]) -> ast.expr:
+    '''
+    Build `{key: value, ...}.get(subject, default)` where default is the
+    value of the last element of seq
+    '''
+    table = seq[:-1]
+    default = seq[-1][2]
+    return ast.Call(
+        func=ast.Attribute(
+            value=ast.Dict(
+                keys=[ast.Constant(key) for _, key, _ in table],
+                values=[ast.Name(v, ast.Load()) for _, _, v in table],
+            ),
+            attr='get',
+            ctx=ast.Load(),
+        ),
+        args=[ast.Name(subject, ast.Load()), ast.Name(default, ast.Load())],
+        keywords=[],
+    )
+
+
 def _fold_conditions(
-        condition_seq: tp.Sequence[tp.Tuple[tp.List[ast.expr], ast.expr]]) -> ast.expr:
+        condition_seq: tp.Sequence[tp.Tuple[tp.Optional[ast.expr], ast.expr]]) -> ast.expr:
     '''
     "Fold" ifExpr over a Sequence of conditons and exprs
     '''
     assert condition_seq
-    conditions, expr = condition_seq[0]
-    if not conditions or len(condition_seq) == 1:
+    condition, expr = condition_seq[0]
+    if condition is None or len(condition_seq) == 1:
         return expr
     else:
         conditional = ast.IfExp(
-            test=ast.BoolOp(
-                op=ast.And(),
-                values=conditions,
-            ),
+            test=condition,
             body=expr,
             orelse=_fold_conditions(condition_seq[1:]),
         )
@@ -452,12 +876,67 @@ class ssa(Pass):
         return_prefix: str
             Controls the name of the return value. Has no functional effects
             as the pass will only ever use free names.
+
+        cond_prefix: str
+            Controls the name of the temporaries branch conditions are
+            hoisted into. Has no functional effects as the pass will only
+            ever use free names.
+
+        balance: bool
+            If balance is True if/elif chains with more than two tests are
+            muxed as a balanced tree of depth log(N) instead of a chain of
+            depth N, e.g.:
+            ```
+            if a:
+                x = 0
+            elif b:
+                x = 1
+            elif c:
+                x = 2
+            else:
+                x = 3
+            ```
+            becomes:
+            ```
+            x0 = 0
+            x1 = 1
+            x2 = 2
+            x3 = 3
+            __cond0 = a or b
+            x4 = (x0 if a else x1) if __cond0 else (x2 if c else x3)
+            ```
+            The folded return value and attribute write backs are balanced
+            in the same way.
+
+        lookup: bool
+            Only has an effect if balance is True.  If lookup is True
+            chains in which every test is of the form `name == constant`,
+            with a distinct constant per test, are muxed with a table lookup:
+            ```
+            x4 = {0: x0, 1: x1, 2: x2}.get(name, x3)
+            ```
+            This assumes name is hashable and that its hash and equality
+            are consistent with `==` on the constants, which does not hold
+            for types overloading `==` (e.g. bit vectors) so it is off by
+            default.
+
+        cleanup: bool
+            If cleanup is True the ssa_cleanup pass is run on the result,
+            removing trivial copies and unused assignments.
     '''
     def __init__(self,
             strict: bool = True,
-            return_prefix: str = '__return_value'):
+            return_prefix: str = '__return_value',
+            cond_prefix: str = '__cond',
+            balance: bool = False,
+            lookup: bool = False,
+            cleanup: bool = False):
         self.strict = strict
         self.return_prefix = return_prefix
+        self.cond_prefix = cond_prefix
+        self.balance = balance
+        self.lookup = lookup
+        self.cleanup = cleanup
 
     def rewrite(self,
             tree: ast.AST,
@@ -471,68 +950,74 @@ class ssa(Pass):
         NR = _never_returns(tree.body)
 
         # Find all attributes that are written
-        targets = collect_targets(tree, ast.Attribute)
-        replacer = AttrReplacer({})
-        init_reads = set()
-        attr_names = {}
-        for t in targets:
+        targets = {}
+        for t in collect_targets(tree, ast.Attribute):
             if not isinstance(t.value, ast.Name):
                 raise NotImplementedError(f'Only supports writing attributes '
                                           f'of Name not {type(t.value)}')
-            else:
-                name = ast.Name(
-                        id=gen_free_name(tree, env, '_'.join((t.value.id, t.attr))),
-                        ctx=ast.Store())
-                # store the maping of names to attrs
-                attr_names[name.id] = t
-                #replace writes to the attr with writes to the name
-                replacer.add_replacement(t, name)
-                #replace reads to the attr with reads to the name
-                replacer.add_replacement(_flip_ctx(t), _flip_ctx(name))
-
-                # read the init value
-                init_reads.add(
-                    immutable(ast.Assign(
-                        targets=[deepcopy(name)],
-                        value=_flip_ctx(t),
-                    ))
-                )
+            targets[_attr_key(t)] = t
+
+        replacer = AttrReplacer({})
+        init_reads = []
+        attr_names = {}
+        for key in sorted(targets):
+            value_id, attr = key
+            name = gen_free_name(tree, env, '_'.join(key))
+            # store the maping of names to attrs
+            attr_names[name] = key
+            # replace reads and writes of the attr with the name
+            replacer.add_replacement(targets[key], ast.Name(name, ast.Store()))
+
+            # read the init value
+            init_reads.append(ast.Assign(
+                targets=[ast.Name(name, ast.Store())],
+                value=_build_attr(value_id, attr, ast.Load()),
+            ))
 
         # Replace references to the attr with the name generated above
         tree = replacer.visit(tree)
 
         # insert initial reads
-        tree.body = [mutable(r) for r in init_reads] + tree.body
+        tree.body = init_reads + tree.body
 
         # Perform ssa
         r_name = gen_free_prefix(tree, env, self.return_prefix)
-        visitor = SSATransformer(env, r_name, attr_names.keys(), self.strict)
+        c_name = gen_free_prefix(tree, env, self.cond_prefix)
+        visitor = SSATransformer(env, r_name, c_name, attr_names.keys(),
+                self.strict, self.balance, self.lookup)
         tree = visitor.visit(tree)
 
         #insert the write backs to the attrs
         for name, conditons in visitor.attr_states.items():
             if conditons:
+                suite, value = visitor._fold(conditons)
+                tree.body.extend(suite)
                 tree.body.append(
                     ast.Assign(
-                        targets=[deepcopy(attr_names[name])],
-                        value=_fold_conditions(conditons)
+                        targets=[_build_attr(*attr_names[name], ast.Store())],
+                        value=value
                     )
                 )
             else:
                 tree.body.append(
                     ast.Assign(
-                        targets=[deepcopy(attr_names[name])],
+                        targets=[_build_attr(*attr_names[name], ast.Store())],
                         value=ast.Name(visitor.name_table[name], ast.Load())
                     )
                 )
 
         # insert the return
         if visitor.returns:
+            suite, value = visitor._fold(visitor.returns)
+            tree.body.extend(suite)
             tree.body.append(
                 ast.Return(
-                    value=_fold_conditions(visitor.returns)
+                    value=value
                 )
             )
         else:
             assert NR
+
+        if self.cleanup:
+            return ssa_cleanup().rewrite(tree, env, metadata)
         return tree, env, metadata
@@ -0,0 +1,168 @@
+import ast
+from collections import Counter
+import typing as tp
+
+from . import Pass
+from . import PASS_ARGS_T
+
+from ast_tools.stack import SymbolTable
+from ast_tools.transformers import Renamer
+
+__ALL__ = ['ssa_cleanup']
+
+_SCOPES = (
+    ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef, ast.Lambda,
+    ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp,
+)
+
+# Expressions which may be dropped if their value is unused.  Like ssa,
+# which evaluates both sides of every branch, this assumes operators and
+# attribute reads do not have side effects.  Calls are never dropped.
+_PURE = (
+    ast.Name, ast.Constant, ast.Num, ast.Str, ast.Bytes, ast.NameConstant,
+    ast.Attribute, ast.Subscript, ast.Index, ast.Slice,
+    ast.IfExp, ast.BoolOp, ast.BinOp, ast.UnaryOp, ast.Compare, ast.Tuple,
+    ast.expr_context, ast.boolop, ast.operator, ast.unaryop, ast.cmpop,
+)
+
+
+def _is_pure(node: ast.expr) -> bool:
+    return all(isinstance(n, _PURE) for n in ast.walk(node))
+
+
+def _single_target(stmt: ast.stmt) -> tp.Optional[str]:
+    if isinstance(stmt, ast.Assign) \
+            and len(stmt.targets) == 1 \
+            and isinstance(stmt.targets[0], ast.Name):
+        return stmt.targets[0].id
+    return None
+
+
+class _NameCounter(ast.NodeVisitor):
+    '''
+    Count loads and stores of each name in a function body.  Names which
+    occur in a nested scope or are declared global / nonlocal are pinned
+    and never rewritten.
+    '''
+    def __init__(self):
+        self.loads = Counter()
+        self.stores = Counter()
+        self.pinned = set()
+
+    def visit_Name(self, node: ast.Name):
+        if isinstance(node.ctx, ast.Store):
+            self.stores[node.id] += 1
+        else:
+            self.loads[node.id] += 1
+
+    def visit_AugAssign(self, node: ast.AugAssign):
+        if isinstance(node.target, ast.Name):
+            self.loads[node.target.id] += 1
+        self.generic_visit(node)
+
+    def visit_Global(self, node: ast.Global):
+        self.pinned.update(node.names)
+
+    visit_Nonlocal = visit_Global
+
+    def generic_visit(self, node: ast.AST):
+        if isinstance(node, _SCOPES):
+            for child in ast.walk(node):
+                if isinstance(child, ast.Name):
+                    self.pinned.add(child.id)
+                    self.loads[child.id] += 1
+                elif isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                    self.pinned.add(child.name)
+                    self.stores[child.name] += 1
+        else:
+            super().generic_visit(node)
+
+
+class ssa_cleanup(Pass):
+    '''
+    Pass to clean up functions in SSA form (see ssa)
+        - muxes whose inputs are the same name are replaced by that name
+        - copies `x = y` are propagated into later uses of x
+        - assignments to names which are never read are removed if their
+          value is side effect free (calls are never removed)
+
+    Only top level assignments to a single name are rewritten.  Names which
+    are used in a nested scope or declared global / nonlocal are left
+    untouched.
+    '''
+    def rewrite(self,
+            tree: ast.AST,
+            env: SymbolTable,
+            metadata: tp.MutableMapping) -> PASS_ARGS_T:
+        if not isinstance(tree, ast.FunctionDef):
+            raise TypeError('ssa_cleanup should only be applied to functions')
+
+        counter = _NameCounter()
+        for stmt in tree.body:
+            counter.visit(stmt)
+
+        params = {a.arg for a in ast.walk(tree.args) if isinstance(a, ast.arg)}
+
+        def _local(name):
+            return name not in counter.pinned and name not in params
+
+        # Copy propagation
+        # defined holds the names whose value can no longer change:
+        # unassigned parameters and names assigned exactly once by a
+        # statement which has already been seen
+        copies = {}
+        defined = {p for p in params if not counter.stores[p]}
+        body = []
+        for stmt in tree.body:
+            if copies:
+                stmt = Renamer(copies).visit(stmt)
+
+            target = _single_target(stmt)
+            if target is not None:
+                value = stmt.value
+                # x = y if c else y  ->  x = y
+                if isinstance(value, ast.IfExp) \
+                        and isinstance(value.body, ast.Name) \
+                        and isinstance(value.orelse, ast.Name) \
+                        and value.body.id == value.orelse.id \
+                        and _is_pure(value.test):
+                    value = stmt.value = value.body
+
+                if isinstance(value, ast.Name) \
+                        and counter.stores[target] == 1 \
+                        and _local(target) \
+                        and value.id in defined:
+                    copies[target] = value.id
+
+                if counter.stores[target] == 1 and _local(target):
+                    defined.add(target)
+
+            body.append(stmt)
+
+        # Dead store elimination
+        loads = Counter()
+        for stmt in body:
+            stmt_counter = _NameCounter()
+            stmt_counter.visit(stmt)
+            loads.update(stmt_counter.loads)
+
+        live = [True] * len(body)
+        writers = {}
+        for idx, stmt in enumerate(body):
+            target = _single_target(stmt)
+            if target is not None and _local(target) and _is_pure(stmt.value):
+                writers.setdefault(target, []).append(idx)
+
+        worklist = [name for name in writers if not loads[name]]
+        while worklist:
+            name = worklist.pop()
+            for idx in writers.pop(name, ()):
+                live[idx] = False
+                for child in ast.walk(body[idx].value):
+                    if isinstance(child, ast.Name):
+                        loads[child.id] -= 1
+                        if not loads[child.id] and child.id in writers:
+                            worklist.append(child.id)
+
+        tree.body = [stmt for stmt, l in zip(body, live) if l] or [ast.Pass()]
+        return tree, env, metadata
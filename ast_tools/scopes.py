@@ -0,0 +1,333 @@
+'''
+Resolves the scopes of the names of a tree following the rules of python,
+comparable to symtable but over ast or immutable_ast nodes
+'''
+import ast
+import typing as tp
+import weakref
+
+from . import immutable_ast
+
+__ALL__ = ['Scope', 'ScopeIndex', 'analyze_scopes']
+
+_FUNCTION_SCOPES = frozenset(('function', 'lambda', 'comprehension'))
+
+_MODULES = frozenset(('Module', 'Expression', 'Interactive'))
+
+_COMPREHENSIONS = frozenset(('ListComp', 'SetComp', 'DictComp', 'GeneratorExp'))
+
+_NODE_TYPES = (ast.AST, immutable_ast.AST)
+
+
+class Scope:
+    '''
+    A module, class, function, lambda or comprehension scope:
+        locals: names bound in the scope (including parameters)
+        globals: names declared global or which resolve to the module
+        nonlocals: names declared nonlocal
+        free: names which resolve to an enclosing function scope
+        cells: locals which are free in a nested scope
+
+    Private names (__x) used in a class and the scopes nested in it are
+    mangled (_C__x) as the compiler does.
+    '''
+    __slots__ = ('_node', 'kind', 'parent', 'children',
+                 'locals', 'globals', 'nonlocals', 'free', 'cells',
+                 '_bound', '_used', '_private')
+
+    def __init__(self, node, kind: str, parent: tp.Optional['Scope']):
+        # Scopes are cached per tree so must not keep it alive
+        self._node = _ref(node)
+        self.kind = kind
+        self.parent = parent
+        self.children = []
+        self.locals = set()
+        self.globals = set()
+        self.nonlocals = set()
+        self.free = set()
+        self.cells = set()
+        self._bound = set()
+        self._used = set()
+        # Name of the innermost class, used to mangle private names
+        if kind == 'class':
+            self._private = node.name
+        else:
+            self._private = parent._private if parent is not None else None
+
+    @property
+    def node(self):
+        '''The node defining the scope, None for the module of a function'''
+        return self._node()
+
+    def __repr__(self):
+        name = getattr(self.node, 'name', None)
+        return f'<Scope {self.kind}{" " + name if name else ""}>'
+
+    def mangle(self, name: str) -> str:
+        '''Returns name as the compiler mangles it in the scope'''
+        return _mangle(self._private, name)
+
+    def resolve(self, name: str) -> str:
+        '''
+        Returns 'local', 'global', 'nonlocal' or 'free' for a name used
+        in the scope (mangled, see mangle)
+        '''
+        if name in self.nonlocals:
+            return 'nonlocal'
+        elif name in self.globals:
+            return 'global'
+        elif name in self.locals:
+            return 'local'
+        elif name in self.free:
+            return 'free'
+        return 'global'
+
+
+def _mangle(private: tp.Optional[str], name: str) -> str:
+    # See _Py_Mangle in CPython/Python/compile.c
+    if private is None or not name.startswith('__') \
+            or name.endswith('__') or '.' in name:
+        return name
+    private = private.lstrip('_')
+    if not private:
+        return name
+    return f'_{private}{name}'
+
+
+def _ref(node) -> tp.Callable[[], tp.Any]:
+    try:
+        return weakref.ref(node)
+    except TypeError:
+        # e.g. None or views, which do not support weak references
+        return lambda: node
+
+
+def _child_nodes(node) -> tp.Iterator:
+    for field in node._fields:
+        value = getattr(node, field, None)
+        if isinstance(value, (list, tuple)):
+            yield from (c for c in value if isinstance(c, _NODE_TYPES))
+        elif isinstance(value, _NODE_TYPES):
+            yield value
+
+
+def _arg_nodes(args) -> tp.List:
+    nodes = list(getattr(args, 'posonlyargs', ())) + list(args.args)
+    if args.vararg is not None:
+        nodes.append(args.vararg)
+    nodes.extend(args.kwonlyargs)
+    if args.kwarg is not None:
+        nodes.append(args.kwarg)
+    return nodes
+
+
+class ScopeIndex:
+    '''
+    The scopes of a tree, built in one pass over it (see analyze_scopes).
+
+    index[node] is the scope defined by a module, class, function, lambda
+    or comprehension node and index.scope_of(node) the scope in which node
+    is evaluated.  Both are dict lookups on the identity of node, so nodes
+    shared between several places of an (interned) immutable tree are
+    mapped to the scope of their last occurrence.
+    '''
+    def __init__(self, tree):
+        self._scopes = {}
+        self._enclosing = {}
+        if tree.__class__.__name__ in _MODULES:
+            self.root = self._new_scope(tree, 'module', None)
+            self._walk([(c, self.root) for c in _child_nodes(tree)])
+            self._enclosing[id(tree)] = self.root
+        else:
+            # e.g. a function, analyzed as if it were defined in a module
+            self.root = Scope(None, 'module', None)
+            self._walk([(tree, self.root)])
+        self._resolve()
+
+    def __getitem__(self, node) -> Scope:
+        return self._scopes[id(node)]
+
+    def __contains__(self, node) -> bool:
+        return id(node) in self._scopes
+
+    def scope_of(self, node) -> Scope:
+        return self._enclosing[id(node)]
+
+    def scopes(self) -> tp.Iterator[Scope]:
+        return iter(self._scopes.values())
+
+    def _new_scope(self, node, kind, parent) -> Scope:
+        scope = Scope(node, kind, parent)
+        if parent is not None:
+            parent.children.append(scope)
+        self._scopes[id(node)] = scope
+        return scope
+
+    def _walk(self, todo: tp.List[tp.Tuple[tp.Any, Scope]]) -> None:
+        enclosing = self._enclosing
+        todo.reverse()
+        while todo:
+            node, scope = todo.pop()
+            enclosing[id(node)] = scope
+            kind = node.__class__.__name__
+            children = None
+            if kind == 'Name':
+                ctx = node.ctx.__class__.__name__
+                if ctx == 'Load':
+                    scope._used.add(_mangle(scope._private, node.id))
+                else:
+                    scope._bound.add(_mangle(scope._private, node.id))
+                continue
+            elif kind in ('FunctionDef', 'AsyncFunctionDef', 'Lambda'):
+                if kind != 'Lambda':
+                    scope._bound.add(_mangle(scope._private, node.name))
+                inner = self._new_scope(
+                    node, 'lambda' if kind == 'Lambda' else 'function', scope)
+                args = node.args
+                enclosing[id(args)] = inner
+                # Decorators, defaults and annotations are evaluated in the
+                # enclosing scope
+                children = [(c, scope) for c in getattr(node, 'decorator_list', ())]
+                children.extend((c, scope) for c in args.defaults)
+                children.extend((c, scope) for c in args.kw_defaults if c is not None)
+                for arg in _arg_nodes(args):
+                    enclosing[id(arg)] = inner
+                    inner._bound.add(_mangle(inner._private, arg.arg))
+                    if arg.annotation is not None:
+                        children.append((arg.annotation, scope))
+                if getattr(node, 'returns', None) is not None:
+                    children.append((node.returns, scope))
+                body = node.body
+                if kind == 'Lambda':
+                    children.append((body, inner))
+                else:
+                    children.extend((c, inner) for c in body)
+            elif kind == 'ClassDef':
+                scope._bound.add(_mangle(scope._private, node.name))
+                inner = self._new_scope(node, 'class', scope)
+                children = [(c, scope) for c in node.decorator_list]
+                children.extend((c, scope) for c in node.bases)
+                children.extend((c, scope) for c in node.keywords)
+                children.extend((c, inner) for c in node.body)
+            elif kind in _COMPREHENSIONS:
+                inner = self._new_scope(node, 'comprehension', scope)
+                generators = node.generators
+                # The first iterable is evaluated in the enclosing scope
+                children = [(generators[0].iter, scope)]
+                for i, gen in enumerate(generators):
+                    enclosing[id(gen)] = inner
+                    children.append((gen.target, inner))
+                    if i:
+                        children.append((gen.iter, inner))
+                    children.extend((c, inner) for c in gen.ifs)
+                if kind == 'DictComp':
+                    children.extend(((node.key, inner), (node.value, inner)))
+                else:
+                    children.append((node.elt, inner))
+            elif kind == 'NamedExpr':
+                # Binds in the nearest enclosing non comprehension scope
+                name = _mangle(scope._private, node.target.id)
+                target = scope
+                while target.kind == 'comprehension':
+                    target._used.add(name)
+                    target = target.parent
+                target._bound.add(name)
+                enclosing[id(node.target)] = scope
+                children = [(node.value, scope)]
+            elif kind == 'Global':
+                scope.globals.update(_mangle(scope._private, n) for n in node.names)
+                continue
+            elif kind == 'Nonlocal':
+                scope.nonlocals.update(_mangle(scope._private, n) for n in node.names)
+                continue
+            elif kind in ('Import', 'ImportFrom'):
+                for alias in node.names:
+                    enclosing[id(alias)] = scope
+                    if alias.name != '*':
+                        name = alias.asname or alias.name.split('.')[0]
+                        scope._bound.add(_mangle(scope._private, name))
+                continue
+            elif kind in ('ExceptHandler', 'MatchAs', 'MatchStar'):
+                if node.name is not None:
+                    scope._bound.add(_mangle(scope._private, node.name))
+            elif kind == 'MatchMapping':
+                if node.rest is not None:
+                    scope._bound.add(_mangle(scope._private, node.rest))
+
+            if children is None:
+                children = [(c, scope) for c in _child_nodes(node)]
+            todo.extend(reversed(children))
+
+    def _resolve(self) -> None:
+        # Parents before children so that the locals of enclosing scopes
+        # are known when names are resolved
+        order = [self.root]
+        for scope in order:
+            order.extend(scope.children)
+            if scope.kind == 'module':
+                scope.locals = scope._bound - scope.nonlocals
+                scope.globals |= scope.locals
+            else:
+                scope.locals = scope._bound - scope.globals - scope.nonlocals
+
+        for scope in order:
+            if scope.kind == 'module':
+                continue
+            names = scope._used | scope.nonlocals
+            names -= scope.locals
+            names -= scope.globals
+            for name in names:
+                if not self._resolve_free(scope, name):
+                    scope.globals.add(name)
+
+        for scope in order:
+            del scope._bound, scope._used
+
+    def _resolve_free(self, scope: Scope, name: str) -> bool:
+        '''
+        Marks name free in scope and the scopes between it and the function
+        scope binding it, returns False if no function scope binds it
+        '''
+        path = [scope]
+        outer = scope.parent
+        while outer is not None and outer.kind != 'module':
+            if outer.kind in _FUNCTION_SCOPES:
+                if name in outer.locals:
+                    outer.cells.add(name)
+                    for s in path:
+                        s.free.add(name)
+                    return True
+                elif name in outer.globals:
+                    return False
+            path.append(outer)
+            outer = outer.parent
+        return False
+
+
+# id(tree) -> (weakref to tree, index)
+_CACHE = {}
+
+
+def analyze_scopes(tree) -> ScopeIndex:
+    '''
+    Returns the ScopeIndex of tree (an ast or immutable_ast node), cached
+    per tree for as long as it is alive.  The tree must not be modified
+    after it is analyzed.
+    '''
+    key = id(tree)
+    try:
+        ref, index = _CACHE[key]
+    except KeyError:
+        pass
+    else:
+        if ref() is tree:
+            return index
+
+    index = ScopeIndex(tree)
+    try:
+        ref = weakref.ref(tree, lambda _: _CACHE.pop(key, None))
+    except TypeError:
+        # e.g. views which do not support weak references
+        return index
+    _CACHE[key] = ref, index
+    return index
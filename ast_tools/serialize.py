@@ -0,0 +1,415 @@
+"""
+Compact binary serialization of ast and immutable_ast trees
+
+The format is a preorder stream of tagged values.  Node types and strings
+are defined inline the first time they are used and referred to by index
+afterwards, integers are zigzag varints and a node which occurs more than
+once (e.g. the shared Load of mutable trees or any subtree of an interned
+immutable tree) is written once and referred back to.  When loading as a
+mutable tree a reference to a node with fields is a copy of the node, so
+that the result can be modified in place.
+
+The output is 2-3x smaller than pickle.  For immutable trees dumps and
+loads are also about 3x faster than pickle, for mutable trees, which
+pickle handles in C, they are about 3x slower.
+"""
+import ast
+import re
+import struct
+import typing as tp
+
+from . import immutable_ast
+from .common import clone
+from .immutable_ast import ImmutableMeta
+
+__ALL__ = ['dumps', 'loads', 'dump', 'load']
+
+_MAGIC = b'ASTB'
+_VERSION = 2
+
+_NONE = 0
+_NODE = 1
+_REF = 2
+_LIST = 3
+_STR = 4
+_INT = 5
+_TRUE = 6
+_FALSE = 7
+_FLOAT = 8
+_COMPLEX = 9
+_BYTES = 10
+_ELLIPSIS = 11
+_TUPLE = 12
+_FROZENSET = 13
+
+_DOUBLE = struct.Struct('<d')
+_DOUBLE2 = struct.Struct('<dd')
+
+_SIGNATURE = re.compile(r'(\w+)([?*]?) (\w+)')
+
+# node type -> fields which hold constants, whose tuples are values rather
+# than sequences of the node
+_CONSTANT_FIELDS = {}
+
+
+def _constant_fields(node_type: type) -> tp.FrozenSet[str]:
+    try:
+        return _CONSTANT_FIELDS[node_type]
+    except KeyError:
+        pass
+    mutable_type = ImmutableMeta._immutable_to_mutable.get(node_type, node_type)
+    doc = (mutable_type.__doc__ or '').split('\n', 1)[0]
+    types = {field: type_ for type_, _, field in _SIGNATURE.findall(doc)}
+    fields = _CONSTANT_FIELDS[node_type] = frozenset(
+        field for field in node_type._fields
+        if types.get(field, 'constant') == 'constant'
+    )
+    return fields
+
+
+def _write_varint(out: bytearray, n: int) -> None:
+    while n > 0x7f:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Seq:
+    # Marks a sequence of a node on the stack of the writer, tuples may
+    # also be constants
+    __slots__ = ('items',)
+
+    def __init__(self, items):
+        self.items = items
+
+
+class _Writer:
+    def __init__(self):
+        self.out = bytearray(_MAGIC)
+        self.out.append(_VERSION)
+        self.strings = {}
+        # node type -> (reference, fields, attributes, sequence fields)
+        self.plans = {}
+        # id(node) -> index, nodes keeps them alive so ids are not reused
+        self.node_ids = {}
+        self.nodes = []
+
+    def write_str(self, s: str) -> None:
+        # 0 defines a new string, otherwise index + 1
+        idx = self.strings.get(s)
+        if idx is None:
+            self.strings[s] = len(self.strings)
+            data = s.encode('utf-8', 'surrogatepass')
+            self.out.append(0)
+            _write_varint(self.out, len(data))
+            self.out += data
+        else:
+            _write_varint(self.out, idx + 1)
+
+    def define_type(self, node_type: type):
+        '''
+        Writes the definition of node_type (0 followed by its name, fields
+        and attributes) and returns its plan, later nodes of the type are
+        written with the reference (index + 1) in the plan
+        '''
+        fields = node_type._fields
+        immutable = isinstance(node_type, ImmutableMeta)
+        attributes = () if immutable else getattr(node_type, '_attributes', ())
+        if immutable:
+            constants = _constant_fields(node_type)
+            seq_fields = frozenset(f for f in fields if f not in constants)
+        else:
+            seq_fields = frozenset()
+        ref = bytearray()
+        _write_varint(ref, len(self.plans) + 1)
+        plan = self.plans[node_type] = bytes(ref), fields, attributes, seq_fields
+
+        self.out.append(0)
+        self.write_str(node_type.__name__)
+        _write_varint(self.out, len(fields))
+        for field in fields:
+            self.write_str(field)
+        _write_varint(self.out, len(attributes))
+        for attr in attributes:
+            self.write_str(attr)
+        return plan
+
+    def write(self, tree: tp.Any) -> None:
+        out = self.out
+        plans = self.plans
+        node_ids = self.node_ids
+        nodes = self.nodes
+        write_str = self.write_str
+        todo = [tree]
+        while todo:
+            value = todo.pop()
+            value_t = type(value)
+            if value_t is _Seq:
+                items = value.items
+                out.append(_LIST)
+                _write_varint(out, len(items))
+                todo.extend(reversed(items))
+            elif value is None:
+                out.append(_NONE)
+            elif value_t is str:
+                out.append(_STR)
+                write_str(value)
+            elif value_t in plans or isinstance(value, (ast.AST, immutable_ast.AST)):
+                idx = node_ids.get(id(value))
+                if idx is not None:
+                    out.append(_REF)
+                    _write_varint(out, idx)
+                    continue
+                node_ids[id(value)] = len(nodes)
+                nodes.append(value)
+
+                out.append(_NODE)
+                plan = plans.get(value_t)
+                if plan is None:
+                    plan = self.define_type(value_t)
+                else:
+                    out += plan[0]
+                _, fields, attributes, seq_fields = plan
+                # Attributes (positions) precede the fields so that they
+                # can be written directly
+                for attr in attributes:
+                    c = getattr(value, attr, None)
+                    if c is None:
+                        out.append(_NONE)
+                    elif type(c) is int:
+                        out.append(_INT)
+                        _write_varint(out, c * 2 if c >= 0 else -c * 2 - 1)
+                    else:
+                        raise TypeError(f'Cannot serialize attribute {attr}={c!r}')
+                children = []
+                for field in fields:
+                    c = getattr(value, field, None)
+                    if type(c) is list or (type(c) is tuple and field in seq_fields):
+                        c = _Seq(c)
+                    children.append(c)
+                children.reverse()
+                todo.extend(children)
+            elif value is True:
+                out.append(_TRUE)
+            elif value is False:
+                out.append(_FALSE)
+            elif isinstance(value, int):
+                out.append(_INT)
+                _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+            elif isinstance(value, str):
+                out.append(_STR)
+                write_str(value)
+            elif isinstance(value, float):
+                out.append(_FLOAT)
+                out += _DOUBLE.pack(value)
+            elif isinstance(value, complex):
+                out.append(_COMPLEX)
+                out += _DOUBLE2.pack(value.real, value.imag)
+            elif isinstance(value, bytes):
+                out.append(_BYTES)
+                _write_varint(out, len(value))
+                out += value
+            elif value is Ellipsis:
+                out.append(_ELLIPSIS)
+            elif isinstance(value, (tuple, frozenset)):
+                out.append(_TUPLE if isinstance(value, tuple) else _FROZENSET)
+                _write_varint(out, len(value))
+                todo.extend(reversed(tuple(value)))
+            else:
+                raise TypeError(f'Cannot serialize {value!r}')
+
+
+def _read_varint(data: bytes, pos: int) -> tp.Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7f) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+class _Reader:
+    def __init__(self, data: tp.Union[bytes, bytearray, memoryview], immutable: bool):
+        data = bytes(data)
+        if data[:len(_MAGIC)] != _MAGIC:
+            raise ValueError('Not a serialized ast')
+        elif data[len(_MAGIC)] != _VERSION:
+            raise ValueError(f'Unsupported version {data[len(_MAGIC)]}')
+        self.data = data
+        self.pos = len(_MAGIC) + 1
+        self.immutable = immutable
+        self.module = immutable_ast if immutable else ast
+        self.strings = []
+        self.types = []
+        self.nodes = []
+
+    def read_str(self) -> str:
+        idx, self.pos = _read_varint(self.data, self.pos)
+        if idx:
+            return self.strings[idx - 1]
+        n, pos = _read_varint(self.data, self.pos)
+        s = str(self.data[pos:pos + n], 'utf-8', 'surrogatepass')
+        self.pos = pos + n
+        self.strings.append(s)
+        return s
+
+    def define_type(self):
+        '''
+        Reads the definition of a node type, returns the type, the fields
+        it is built from (field, index in values) and its attributes
+        '''
+        name = self.read_str()
+        node_type = getattr(self.module, name, None)
+        if not (isinstance(node_type, type)
+                and issubclass(node_type, (ast.AST, immutable_ast.AST))):
+            raise ValueError(f'Unknown node type {name!r}')
+        n, self.pos = _read_varint(self.data, self.pos)
+        fields = [self.read_str() for _ in range(n)]
+        n, self.pos = _read_varint(self.data, self.pos)
+        attributes = [self.read_str() for _ in range(n)]
+
+        # The values of a node are its attributes followed by its fields
+        index = {f: i for i, f in enumerate(fields, len(attributes))}
+        build_fields = tuple((f, index.get(f)) for f in node_type._fields)
+        build_attributes = tuple(
+            (a, i) for i, a in enumerate(attributes) if not self.immutable)
+        entry = node_type, len(fields) + len(attributes), build_fields, build_attributes
+        self.types.append(entry)
+        return entry
+
+    def read(self) -> tp.Any:
+        data = self.data
+        immutable = self.immutable
+        seq_t = tuple if immutable else list
+        types = self.types
+        nodes = self.nodes
+        setattr_ = object.__setattr__
+        new = object.__new__
+        ast_new = ast.AST.__new__
+        # frames: [kind, size, values, info]
+        stack = []
+        pos = self.pos
+        while True:
+            tag = data[pos]
+            pos += 1
+            if tag == _NODE:
+                idx = data[pos]
+                pos += 1
+                if idx >= 0x80:
+                    idx, pos = _read_varint(data, pos - 1)
+                if idx:
+                    entry = types[idx - 1]
+                else:
+                    self.pos = pos
+                    entry = self.define_type()
+                    pos = self.pos
+                frame = [_NODE, entry[1], [], (entry, len(nodes))]
+                nodes.append(None)
+            elif tag == _LIST or tag == _TUPLE or tag == _FROZENSET:
+                n, pos = _read_varint(data, pos)
+                frame = [tag, n, [], None]
+            else:
+                frame = None
+                if tag == _STR:
+                    self.pos = pos
+                    value = self.read_str()
+                    pos = self.pos
+                elif tag == _NONE:
+                    value = None
+                elif tag == _REF:
+                    n, pos = _read_varint(data, pos)
+                    value = nodes[n]
+                    if not immutable and value._fields:
+                        # Mutable nodes must not be shared
+                        value = clone(value)
+                elif tag == _INT:
+                    n, pos = _read_varint(data, pos)
+                    value = n >> 1 if not n & 1 else -((n + 1) >> 1)
+                elif tag == _TRUE:
+                    value = True
+                elif tag == _FALSE:
+                    value = False
+                elif tag == _FLOAT:
+                    value, = _DOUBLE.unpack_from(data, pos)
+                    pos += _DOUBLE.size
+                elif tag == _COMPLEX:
+                    real, imag = _DOUBLE2.unpack_from(data, pos)
+                    pos += _DOUBLE2.size
+                    value = complex(real, imag)
+                elif tag == _BYTES:
+                    n, pos = _read_varint(data, pos)
+                    value = data[pos:pos + n]
+                    pos += n
+                elif tag == _ELLIPSIS:
+                    value = Ellipsis
+                else:
+                    raise ValueError(f'Unknown tag {tag}')
+
+            if frame is not None:
+                stack.append(frame)
+                if frame[1]:
+                    continue
+                done = True
+            else:
+                done = False
+
+            # Deliver value to the enclosing frames, completing them
+            while stack:
+                if done:
+                    done = False
+                else:
+                    frame = stack[-1]
+                    frame[2].append(value)
+                    if len(frame[2]) < frame[1]:
+                        break
+                kind, _, values, info = stack.pop()
+                if kind == _NODE:
+                    (node_type, _, build_fields, build_attributes), idx = info
+                    if immutable:
+                        value = new(node_type)
+                        for field, i in build_fields:
+                            setattr_(value, field, None if i is None else values[i])
+                    else:
+                        value = ast_new(node_type)
+                        attrs = value.__dict__
+                        for field, i in build_fields:
+                            if i is not None:
+                                attrs[field] = values[i]
+                        for attr, i in build_attributes:
+                            if values[i] is not None:
+                                attrs[attr] = values[i]
+                    nodes[idx] = value
+                elif kind == _LIST:
+                    value = seq_t(values)
+                elif kind == _TUPLE:
+                    value = tuple(values)
+                else:
+                    value = frozenset(values)
+            else:
+                self.pos = pos
+                return value
+
+
+def dumps(tree: tp.Any) -> bytes:
+    '''Serializes an ast or immutable_ast tree'''
+    writer = _Writer()
+    writer.write(tree)
+    return bytes(writer.out)
+
+
+def loads(data: tp.Union[bytes, bytearray, memoryview], immutable: bool = False) -> tp.Any:
+    '''
+    Deserializes a tree written by dumps, as an immutable_ast tree if
+    immutable is True else as an ast tree
+    '''
+    return _Reader(data, immutable).read()
+
+
+def dump(tree: tp.Any, file: tp.BinaryIO) -> None:
+    file.write(dumps(tree))
+
+
+def load(file: tp.BinaryIO, immutable: bool = False) -> tp.Any:
+    return loads(file.read(), immutable)
@@ -0,0 +1,194 @@
+"""
+Defines a file of ASTs which any number of processes can open with mmap
+
+Each tree is written in its columnar form (see columnar).  The columns are
+read in place from the mapped file and nodes are presented as immutable_ast
+nodes which are built when they are accessed, so the columns of a store
+parsed once are shared by all the processes reading it.  The per tree
+tables (types, field names, strings and the scalar fields of nodes) are
+pickled and loaded into the private memory of each process which opens the
+tree; for source code they are a fair part of the size of a tree (about
+a fifth of the columns for inspect.py) so a store is not zero-copy.
+"""
+import ast
+import mmap
+import pickle
+import struct
+import sys
+import typing as tp
+from collections.abc import Mapping
+
+from . import immutable_ast
+from .columnar import ColumnarTree
+from .immutable_ast import ImmutableMeta, LazyView, immutable
+
+__ALL__ = ['write_store', 'ASTStore', 'StoredView']
+
+_MAGIC = b'ASTS'
+_VERSION = 1
+# magic, version, offset of the index
+_HEADER = struct.Struct('<4sB3xQ')
+
+_COLUMNS = ('kinds', 'parents', 'ends', 'fields', 'ctx', 'idents', 'positions')
+
+
+def _align(f: tp.BinaryIO) -> None:
+    f.write(bytes(-f.tell() % 8))
+
+
+def write_store(path: str, trees: tp.Mapping[str, tp.Union[ast.AST, ColumnarTree]]) -> None:
+    '''
+    Writes trees (asts or columnar trees) to path to be opened with
+    ASTStore
+    '''
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(_MAGIC, _VERSION, 0))
+        entries = {}
+        for key, tree in trees.items():
+            if not isinstance(tree, ColumnarTree):
+                tree = ColumnarTree.from_ast(tree)
+            buffers = {}
+            for name in _COLUMNS:
+                buffer = memoryview(getattr(tree, name))
+                _align(f)
+                buffers[name] = f.tell(), buffer.format, len(buffer)
+                f.write(buffer)
+            meta = pickle.dumps((
+                [t.__name__ for t in tree.types],
+                tree.field_names,
+                tree.strings,
+                tree.scalars,
+            ))
+            entries[key] = f.tell(), len(meta), buffers
+            f.write(meta)
+
+        _align(f)
+        index_offset = f.tell()
+        f.write(pickle.dumps((sys.byteorder, entries)))
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, _VERSION, index_offset))
+
+
+class ASTStore(Mapping):
+    '''
+    Read only mapping from keys to the trees of a file written by
+    write_store.  Trees are StoredViews of their roots, ColumnarTrees whose
+    columns are memoryviews of the file are available from `columns`.
+
+    The index and the per tree tables (types, strings and scalar fields)
+    are pickled, so only open stores from a trusted source.
+    '''
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._buffers = []
+        self._columns = {}
+        magic, version, index_offset = _HEADER.unpack_from(self._mmap)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError('Not an ast store')
+        elif version != _VERSION:
+            self.close()
+            raise ValueError(f'Unsupported version {version}')
+        byteorder, self._entries = pickle.loads(self._mmap[index_offset:])
+        if byteorder != sys.byteorder:
+            self.close()
+            raise ValueError('Store was written with a different byte order')
+
+    def close(self) -> None:
+        self._columns.clear()
+        for buffer in reversed(self._buffers):
+            buffer.release()
+        self._buffers.clear()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self) -> 'ASTStore':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __getitem__(self, key: str) -> 'StoredView':
+        return StoredView(self.columns(key), 0)
+
+    def __iter__(self) -> tp.Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def columns(self, key: str) -> ColumnarTree:
+        '''
+        The columnar tree of key.  Its `nodes` is None as there are no
+        original nodes.
+        '''
+        try:
+            return self._columns[key]
+        except KeyError:
+            pass
+
+        meta_offset, meta_len, buffers = self._entries[key]
+        type_names, field_names, strings, scalars = pickle.loads(
+            self._mmap[meta_offset:meta_offset + meta_len])
+        columns = ColumnarTree()
+        for name in type_names:
+            columns.type_code(getattr(ast, name))
+        for name in field_names:
+            columns.field_code(name)
+        for s in strings:
+            columns.string_id(s)
+        columns.scalars = scalars
+
+        data = memoryview(self._mmap)
+        self._buffers.append(data)
+        for name, (offset, fmt, length) in buffers.items():
+            raw = data[offset:offset + length * struct.calcsize(fmt)]
+            buffer = raw.cast(fmt)
+            self._buffers.extend((raw, buffer))
+            setattr(columns, name, buffer)
+
+        self._columns[key] = columns
+        return columns
+
+
+class StoredView(LazyView):
+    '''
+    Read only view of a node of a columnar tree as an immutable ast.  The
+    fields of the node are built the first time one of them is accessed,
+    children are again views.
+    '''
+    __slots__ = ('_columns', '_idx', '_cache')
+
+    def __init__(self, columns: ColumnarTree, idx: int):
+        object.__setattr__(self, '_columns', columns)
+        object.__setattr__(self, '_idx', idx)
+        object.__setattr__(self, '_cache', None)
+
+    def _view_class(self) -> type:
+        columns = self._columns
+        node_type = columns.types[columns.kinds[self._idx]]
+        return ImmutableMeta._mutable_to_immutable[node_type]
+
+    def __getattr__(self, attr):
+        cache = self._cache
+        if cache is None:
+            columns = self._columns
+            cache = columns.node_fields(
+                self._idx,
+                lambda c: StoredView(columns, c),
+                tuple,
+                immutable_ast)
+            object.__setattr__(self, '_cache', cache)
+        try:
+            return cache[attr]
+        except KeyError:
+            raise AttributeError(attr) from None
+
+    def materialize(self) -> immutable_ast.AST:
+        '''Converts the subtree of the view to an immutable ast'''
+        return immutable(self._columns.to_ast(self._idx))
@@ -1,26 +1,29 @@
 import ast
-from copy import deepcopy
-import astor
 from .symbol_replacer import replace_symbols
-from ..macros import inline
+from ..macros import MacroEvaluator, inline, register_macro
+
+
+@register_macro(inline, ast.If, 'test')
+def expand_inline(node: ast.If, cond_obj: inline, env, root=None):
+    '''
+    Returns the statements replacing the if node on cond_obj
+    '''
+    if cond_obj:
+        return node.body
+    else:
+        return node.orelse
 
 
 class Inliner(ast.NodeTransformer):
     def __init__(self, env):
         self.env = env
+        self.evaluate = MacroEvaluator(env)
 
     def visit_If(self, node):
         node = super().generic_visit(node)
-        try:
-            cond_obj = eval(astor.to_source(node.test), {}, self.env)
-            is_constant = True
-        except Exception as e:
-            is_constant = False
-        if is_constant and isinstance(cond_obj, inline):
-            if cond_obj:
-                return node.body
-            else:
-                return node.orelse
+        cond_obj = self.evaluate(node.test)
+        if isinstance(cond_obj, inline):
+            return expand_inline(node, cond_obj, self.env)
         return node
 
 
@@ -1,8 +1,8 @@
 import ast
-from copy import deepcopy
-import astor
-from .symbol_replacer import replace_symbols
-from ..macros import unroll
+import typing as tp
+
+from ..common import clone, gen_free_name
+from ..macros import MacroEvaluator, register_macro, unroll
 
 
 def is_call(node):
@@ -13,31 +13,151 @@ def is_name(node):
     return isinstance(node, ast.Name)
 
 
+class _Template:
+    '''
+    A loop body with the uses of the loop variable located once, so that
+    each instantiation is a single copy of the body
+    '''
+    def __init__(self, body: tp.List[ast.stmt], target: str):
+        self.body = body
+        self.holes = [
+            id(node) for stmt in body for node in ast.walk(stmt)
+            if isinstance(node, ast.Name) and node.id == target
+        ]
+
+    def instantiate(self, value: ast.expr) -> tp.List[ast.stmt]:
+        return clone(self.body,
+                     share_leaves=True,
+                     substitute=dict.fromkeys(self.holes, value))
+
+
+def _is_progression(values: tp.Sequence[int]) -> bool:
+    if len(values) < 2 or values[0] == values[1]:
+        return False
+    step = values[1] - values[0]
+    return all(b - a == step for a, b in zip(values, values[1:]))
+
+
+def _exits_loop(stmts: tp.List[ast.stmt]) -> bool:
+    '''
+    Returns True if stmts contain a break or continue of the enclosing loop
+    '''
+    todo = list(stmts)
+    while todo:
+        node = todo.pop()
+        if isinstance(node, (ast.Break, ast.Continue)):
+            return True
+        elif isinstance(node, (ast.For, ast.AsyncFor, ast.While)):
+            # break / continue in the body belong to the nested loop
+            todo.extend(node.orelse)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef,
+                               ast.ClassDef, ast.Lambda)):
+            continue
+        else:
+            todo.extend(ast.iter_child_nodes(node))
+    return False
+
+
+@register_macro(unroll, ast.For, 'iter')
+def expand_unroll(node: ast.For, iter_obj: unroll, env, root=None):
+    '''
+    Returns the statements replacing the loop node over iter_obj
+    '''
+    values = list(iter_obj)
+    for i in values:
+        if not isinstance(i, int):
+            raise NotImplementedError("Unrolling over iterator of"
+                                      "non-int")
+    template = _Template(node.body, node.target.id)
+    factor = iter_obj.factor
+    if factor is None or factor >= len(values):
+        body = []
+        for i in values:
+            body.extend(template.instantiate(ast.Num(i)))
+    else:
+        if _exits_loop(node.body):
+            raise NotImplementedError("Partial unrolling of loops with "
+                                      "break or continue")
+        if root is None:
+            root = node
+        body = _partial_unroll(node, template, values, factor, env, root)
+    # The loop can only be left by exhausting it, so else always runs
+    body.extend(node.orelse)
+    return body
+
+
+def _partial_unroll(node, template, values, factor, env, root):
+    '''
+    Emit a loop over groups of factor values whose body is factor
+    instances of the loop body, followed by a loop over the remaining
+    values
+    '''
+    n_main = len(values) - len(values) % factor
+    main, rest = values[:n_main], values[n_main:]
+    body = []
+    if main and _is_progression(values) and env.get('range', range) is range:
+        step = values[1] - values[0]
+        base = gen_free_name(root, env, f'__{node.target.id}_base')
+        copies = []
+        for m in range(factor):
+            value = ast.Name(base, ast.Load())
+            if m:
+                value = ast.BinOp(value, ast.Add(), ast.Num(m * step))
+            copies.extend(template.instantiate(value))
+        body.append(ast.For(
+            target=ast.Name(base, ast.Store()),
+            iter=ast.Call(
+                func=ast.Name('range', ast.Load()),
+                args=[
+                    ast.Num(main[0]),
+                    ast.Num(main[0] + n_main * step),
+                    ast.Num(factor * step)],
+                keywords=[]),
+            body=copies,
+            orelse=[]))
+    elif main:
+        names = [
+            gen_free_name(root, env, f'__{node.target.id}_{m}')
+            for m in range(factor)
+        ]
+        copies = []
+        for name in names:
+            copies.extend(template.instantiate(ast.Name(name, ast.Load())))
+        body.append(ast.For(
+            target=ast.Tuple(
+                [ast.Name(name, ast.Store()) for name in names],
+                ast.Store()),
+            iter=ast.Tuple([
+                ast.Tuple(
+                    [ast.Num(i) for i in main[k:k+factor]],
+                    ast.Load())
+                for k in range(0, n_main, factor)],
+                ast.Load()),
+            body=copies,
+            orelse=[]))
+
+    if rest:
+        body.append(ast.For(
+            target=ast.Name(node.target.id, ast.Store()),
+            iter=ast.Tuple([ast.Num(i) for i in rest], ast.Load()),
+            body=clone(node.body, share_leaves=True),
+            orelse=[]))
+    return body
+
+
 class Unroller(ast.NodeTransformer):
-    def __init__(self, env):
+    def __init__(self, env, root=None):
         self.env = env
+        self.evaluate = MacroEvaluator(env)
+        self.root = root
 
     def visit_For(self, node):
         node = super().generic_visit(node)
-        try:
-            iter_obj = eval(astor.to_source(node.iter), {}, self.env)
-            is_constant = True
-        except Exception as e:
-            is_constant = False
-        if is_constant and isinstance(iter_obj, unroll):
-            body = []
-            for i in iter_obj:
-                if not isinstance(i, int):
-                    raise NotImplementedError("Unrolling over iterator of"
-                                              "non-int")
-                symbol_table = {node.target.id: ast.Num(i)}
-                for child in node.body:
-                    body.append(
-                        replace_symbols(deepcopy(child), symbol_table)
-                    )
-            return body
+        iter_obj = self.evaluate(node.iter)
+        if isinstance(iter_obj, unroll):
+            return expand_unroll(node, iter_obj, self.env, self.root)
         return node
 
 
 def unroll_for_loops(tree, env):
-    return Unroller(env).visit(tree)
+    return Unroller(env, tree).visit(tree)
@@ -0,0 +1,54 @@
+import ast
+import typing as tp
+
+from ..macros import MacroEvaluator, get_expansion, macro_fields, macro_types
+# Register the builtin macros
+from . import if_inliner, loop_unroller
+
+
+class MacroExpander(ast.NodeTransformer):
+    '''
+    Expands all registered macros (see ast_tools.macros.register_macro) in
+    a single top down walk.  The replacement of a macro is walked in turn,
+    so macros exposed by an expansion (e.g. an inline whose condition
+    depends on the variable of an enclosing unroll) are expanded as well.
+    Every node of the result is visited once, subtrees are never rewalked.
+    '''
+    def __init__(self, env, root=None):
+        self.env = env
+        self.root = root
+        self.fields = macro_fields()
+        self.evaluate = MacroEvaluator(env, macro_types())
+
+    def visit(self, node):
+        for field in self.fields.get(type(node), ()):
+            macro = self.evaluate(getattr(node, field))
+            if macro is None:
+                continue
+            entry = get_expansion(macro, type(node))
+            if entry is None or entry[0] != field:
+                continue
+            return self._visit_replacement(
+                entry[1](node, macro, self.env, self.root))
+        return self.generic_visit(node)
+
+    def _visit_replacement(self, replacement):
+        if replacement is None:
+            return None
+        elif isinstance(replacement, ast.AST):
+            return self.visit(replacement)
+
+        nodes = []
+        for node in replacement:
+            node = self.visit(node)
+            if node is None:
+                continue
+            elif isinstance(node, ast.AST):
+                nodes.append(node)
+            else:
+                nodes.extend(node)
+        return nodes
+
+
+def expand_macros(tree, env):
+    return MacroExpander(env, tree).visit(tree)
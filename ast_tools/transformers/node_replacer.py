@@ -1,9 +1,11 @@
 import abc
 import ast
-from copy import deepcopy
+from ..common import clone
+from ..visitors.dispatch import DispatchTransformer
 
-class NodeReplacer(ast.NodeTransformer, metaclass=abc.ABCMeta):
+class NodeReplacer(DispatchTransformer, metaclass=abc.ABCMeta):
     def __init__(self, node_table):
+        super().__init__()
         self.node_table = node_table
 
     def visit(self, node):
@@ -11,7 +13,7 @@ class NodeReplacer(ast.NodeTransformer, metaclass=abc.ABCMeta):
         if key is None or key not in self.node_table:
             return super().visit(node)
         else:
-            return deepcopy(self.node_table[key])
+            return clone(self.node_table[key], share_leaves=True)
 
     def add_replacement(self, node, replacement):
         key = self._get_key(node)
@@ -1,9 +1,12 @@
 import ast
 import typing as tp
 
+from ..visitors.dispatch import DispatchTransformer
 
-class Renamer(ast.NodeTransformer):
+
+class Renamer(DispatchTransformer):
     def __init__(self, name_map: tp.Mapping[str, str]):
+        super().__init__()
         self.name_map = name_map
 
     def visit_Name(self, node):
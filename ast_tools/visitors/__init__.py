@@ -1,3 +1,5 @@
+from .dispatch import *
+from .name_facts import *
 from .used_names import *
 from .collect_names import *
 from .collect_targets import *
@@ -4,8 +4,12 @@ Defines a visitor that collects all names contained in an AST
 
 import ast
 
+from ..columnar import ColumnarTree, _CTX_CODES
+from .dispatch import DispatchVisitor
+from .name_facts import name_facts
 
-class NameCollector(ast.NodeVisitor):
+
+class NameCollector(DispatchVisitor):
     """
     Collect all instances of `Name` in an AST
     """
@@ -15,6 +19,7 @@ class NameCollector(ast.NodeVisitor):
         Set `ctx` to `ast.Store` or `ast.Load` to filter for names that are
         being loaded or stored into
         """
+        super().__init__()
         self.names = set()
         self.ctx = ctx
 
@@ -29,8 +34,17 @@ class NameCollector(ast.NodeVisitor):
 
 def collect_names(tree, ctx=None):
     """
-    Convenience wrapper for NameCollector
+    Collects the same names as NameCollector, from the NameFacts of `tree`
+    or with a scan over its columns if it is a ColumnarTree
     """
-    visitor = NameCollector(ctx)
-    visitor.visit(tree)
-    return visitor.names
+    if not isinstance(tree, ColumnarTree):
+        return name_facts(tree).names(ctx)
+    columns = tree
+    names = columns.find(ast.Name)
+    idents = columns.idents
+    strings = columns.strings
+    if ctx is not None:
+        codes = {code for t, code in _CTX_CODES.items() if issubclass(t, ctx)}
+        node_ctx = columns.ctx
+        names = [i for i in names if node_ctx[i] in codes]
+    return {strings[idents[i]] for i in names}
@@ -4,13 +4,18 @@ Defines a visitor that collects all assignment targets contained in an AST
 import ast
 import functools
 
+from ..columnar import ColumnarTree
+from .dispatch import DispatchVisitor
+from .name_facts import name_facts
+
 def _filt(t):
     def wrapped(obj):
         return isinstance(obj, t)
     return wrapped
 
-class TargetCollector(ast.NodeVisitor):
+class TargetCollector(DispatchVisitor):
     def __init__(self, target_filter=None):
+        super().__init__()
         if target_filter is None:
             target_filter = ast.AST
         self.target_filter = _filt(target_filter)
@@ -21,8 +26,28 @@ class TargetCollector(ast.NodeVisitor):
 
 
 def collect_targets(tree, target_filter=None):
-    visitor = TargetCollector(target_filter)
-    visitor.visit(tree)
-    return visitor.targets
+    '''
+    Collects the same targets as TargetCollector, from the NameFacts of
+    tree or with a scan over its columns if it is a ColumnarTree.  The
+    targets of a ColumnarTree without nodes (e.g. from an ASTStore) are
+    built with to_ast, so they are new nodes on each call.
+    '''
+    if target_filter is None:
+        target_filter = ast.AST
+    if not isinstance(tree, ColumnarTree):
+        return set(filter(_filt(target_filter), name_facts(tree).assign_targets))
+    columns = tree
+    assigns = set(columns.codes_of(ast.Assign))
+    matches = set(columns.codes_of(target_filter))
+    kinds = columns.kinds
+    parents = columns.parents
+    if columns.nodes is None:
+        node = columns.to_ast
+    else:
+        node = columns.nodes.__getitem__
+    return {
+        node(i) for i in columns.find_field('targets')
+        if kinds[i] in matches and kinds[parents[i]] in assigns
+    }
 
 
@@ -0,0 +1,154 @@
+"""
+Defines visitor and transformer base classes which dispatch through a
+table built once per visitor instead of looking up `visit_<ClassName>`
+for every node
+"""
+import ast
+import re
+import typing as tp
+
+__ALL__ = ['DispatchVisitor', 'DispatchTransformer']
+
+# ASDL types of fields which never hold nodes
+_SCALAR_TYPES = frozenset(('identifier', 'string', 'int', 'constant'))
+
+_SIGNATURE = re.compile(r'(\w+)([?*]?) (\w+)')
+
+# node type -> fields which may hold nodes
+_CHILD_FIELDS = {}
+
+_NODE_TYPES = tuple(
+    obj for obj in vars(ast).values()
+    if isinstance(obj, type) and issubclass(obj, ast.AST)
+)
+
+
+def _child_fields(node_type: type) -> tp.Tuple[str, ...]:
+    '''
+    Fields of node_type which may hold nodes, read from the ASDL signature
+    in the docstring of the node class.  Fields missing from the signature
+    (e.g. of user defined nodes) are assumed to hold nodes.
+    '''
+    try:
+        return _CHILD_FIELDS[node_type]
+    except KeyError:
+        pass
+
+    types = {}
+    doc = node_type.__doc__ or ''
+    for type_, _, field in _SIGNATURE.findall(doc.split('\n', 1)[0]):
+        types[field] = type_
+
+    fields = _CHILD_FIELDS[node_type] = tuple(
+        field for field in node_type._fields
+        if types.get(field) not in _SCALAR_TYPES
+    )
+    return fields
+
+
+def _children(node: ast.AST) -> tp.List[ast.AST]:
+    children = []
+    for field in _child_fields(type(node)):
+        value = getattr(node, field, None)
+        if isinstance(value, list):
+            children.extend(c for c in value if isinstance(c, ast.AST))
+        elif isinstance(value, ast.AST):
+            children.append(value)
+    return children
+
+
+def _dispatch_table(cls: type, base: type) -> tp.Dict[type, tp.Callable]:
+    '''
+    Maps each node type to the visit_ function of cls for it.  Functions
+    inherited from base (the deprecated visit_Constant forwarding of
+    ast.NodeVisitor) are not dispatched to.
+    '''
+    table = {}
+    for node_type in _NODE_TYPES:
+        name = 'visit_' + node_type.__name__
+        method = getattr(cls, name, None)
+        if method is not None and method is not getattr(base, name, None):
+            table[node_type] = method
+    return table
+
+
+class DispatchVisitor(ast.NodeVisitor):
+    '''
+    ast.NodeVisitor which looks up handlers in a table built once per
+    class and walks the tree with an explicit stack.
+
+    Subclasses define visit_<ClassName> methods as usual.  As with
+    ast.NodeVisitor, generic_visit visits all the children of a node before
+    it returns, only the nodes without a handler are walked without
+    recursion.
+    '''
+    _handlers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._handlers = _dispatch_table(cls, ast.NodeVisitor)
+
+    def visit(self, node: ast.AST) -> tp.Any:
+        handler = self._handlers.get(type(node))
+        if handler is not None:
+            return handler(self, node)
+        self.generic_visit(node)
+
+    def generic_visit(self, node: ast.AST) -> None:
+        if type(self).visit is not DispatchVisitor.visit:
+            # visit is overridden so must be called for each child
+            for child in _children(node):
+                self.visit(child)
+            return
+
+        handlers = self._handlers
+        todo = _children(node)
+        todo.reverse()
+        while todo:
+            node = todo.pop()
+            handler = handlers.get(type(node))
+            if handler is None:
+                todo.extend(reversed(_children(node)))
+            else:
+                handler(self, node)
+
+
+class DispatchTransformer(ast.NodeTransformer):
+    '''
+    ast.NodeTransformer which looks up handlers in a table built once per
+    class and only visits the fields which may hold nodes.
+    '''
+    _handlers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._handlers = _dispatch_table(cls, ast.NodeTransformer)
+
+    def visit(self, node: ast.AST) -> tp.Any:
+        handler = self._handlers.get(type(node))
+        if handler is not None:
+            return handler(self, node)
+        return self.generic_visit(node)
+
+    def generic_visit(self, node: ast.AST) -> ast.AST:
+        for field in _child_fields(type(node)):
+            old_value = getattr(node, field, None)
+            if isinstance(old_value, list):
+                new_values = []
+                for value in old_value:
+                    if isinstance(value, ast.AST):
+                        value = self.visit(value)
+                        if value is None:
+                            continue
+                        elif not isinstance(value, ast.AST):
+                            new_values.extend(value)
+                            continue
+                    new_values.append(value)
+                old_value[:] = new_values
+            elif isinstance(old_value, ast.AST):
+                new_node = self.visit(old_value)
+                if new_node is None:
+                    delattr(node, field)
+                else:
+                    setattr(node, field, new_node)
+        return node
@@ -0,0 +1,143 @@
+"""
+Defines a visitor that collects the facts about names used by the other
+collectors in a single pass
+"""
+import ast
+import typing as tp
+import weakref
+
+from .dispatch import DispatchVisitor
+
+__ALL__ = ['NameFacts', 'NameFactsCollector', 'name_facts']
+
+
+class NameFacts:
+    '''
+    Facts about the names of a tree:
+        loads, stores, dels: ids of the Name nodes by context
+        defs: names of the functions and classes defined
+        outer_names: ids of the Name nodes and names of the defs which are
+            not nested in a def (see used_names)
+        assign_targets: targets of Assign nodes
+        targets: targets of Assign, AugAssign, AnnAssign, NamedExpr, For,
+            AsyncFor and with items
+        attribute_stores: Attribute nodes which are stored to
+    '''
+    __slots__ = ('loads', 'stores', 'dels', 'defs', 'outer_names',
+                 'assign_targets', 'targets', 'attribute_stores')
+
+    def __init__(self):
+        self.loads = set()
+        self.stores = set()
+        self.dels = set()
+        self.defs = set()
+        self.outer_names = set()
+        self.assign_targets = []
+        self.targets = []
+        self.attribute_stores = []
+
+    def names(self, ctx: tp.Optional[tp.Type[ast.expr_context]] = None) -> tp.Set[str]:
+        '''
+        Ids of the Name nodes whose context is an instance of ctx, or of all
+        Name nodes if ctx is None
+        '''
+        names = set()
+        for ctx_type, ids in ((ast.Load, self.loads),
+                              (ast.Store, self.stores),
+                              (ast.Del, self.dels)):
+            if ctx is None or issubclass(ctx_type, ctx):
+                names |= ids
+        return names
+
+
+class NameFactsCollector(DispatchVisitor):
+    '''
+    Collects the NameFacts of a tree in one pass
+    '''
+    def __init__(self):
+        super().__init__()
+        self.facts = NameFacts()
+        self._depth = 0
+
+    def visit_Name(self, node: ast.Name):
+        facts = self.facts
+        if isinstance(node.ctx, ast.Store):
+            facts.stores.add(node.id)
+        elif isinstance(node.ctx, ast.Del):
+            facts.dels.add(node.id)
+        else:
+            facts.loads.add(node.id)
+        if not self._depth:
+            facts.outer_names.add(node.id)
+
+    def _visit_def(self, node: tp.Union[ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef]):
+        self.facts.defs.add(node.name)
+        if not self._depth:
+            self.facts.outer_names.add(node.name)
+        self._depth += 1
+        try:
+            self.generic_visit(node)
+        finally:
+            self._depth -= 1
+
+    visit_FunctionDef = _visit_def
+    visit_AsyncFunctionDef = _visit_def
+    visit_ClassDef = _visit_def
+
+    def visit_Assign(self, node: ast.Assign):
+        self.facts.assign_targets.extend(node.targets)
+        self.facts.targets.extend(node.targets)
+        self.generic_visit(node)
+
+    def _visit_target(self, node: tp.Union[ast.AugAssign, ast.AnnAssign, ast.NamedExpr,
+                                           ast.For, ast.AsyncFor]):
+        self.facts.targets.append(node.target)
+        self.generic_visit(node)
+
+    visit_AugAssign = _visit_target
+    visit_AnnAssign = _visit_target
+    visit_NamedExpr = _visit_target
+    visit_For = _visit_target
+    visit_AsyncFor = _visit_target
+
+    def visit_withitem(self, node: ast.withitem):
+        if node.optional_vars is not None:
+            self.facts.targets.append(node.optional_vars)
+        self.generic_visit(node)
+
+    def visit_Attribute(self, node: ast.Attribute):
+        if isinstance(node.ctx, ast.Store):
+            self.facts.attribute_stores.append(node)
+        self.generic_visit(node)
+
+
+# id(tree) -> (weakref to tree, facts)
+_CACHE = {}
+
+
+def name_facts(tree: ast.AST) -> NameFacts:
+    '''
+    Returns the NameFacts of tree, cached per tree for as long as it is
+    alive so that the helpers projecting them (collect_names,
+    collect_targets, used_names) share one walk.  The tree must not be
+    modified after it is analyzed, use NameFactsCollector directly for
+    trees which are.
+    '''
+    key = id(tree)
+    try:
+        ref, facts = _CACHE[key]
+    except KeyError:
+        pass
+    else:
+        if ref() is tree:
+            return facts
+
+    visitor = NameFactsCollector()
+    visitor.visit(tree)
+    facts = visitor.facts
+    try:
+        ref = weakref.ref(tree, lambda _: _CACHE.pop(key, None))
+    except TypeError:
+        return facts
+    _CACHE[key] = ref, facts
+    return facts
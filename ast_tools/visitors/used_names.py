@@ -1,8 +1,12 @@
 import ast
-from functools import lru_cache
 
-class UsedNames(ast.NodeVisitor):
+from ..columnar import ColumnarTree
+from .dispatch import DispatchVisitor
+from .name_facts import name_facts
+
+class UsedNames(DispatchVisitor):
     def __init__(self):
+        super().__init__()
         self.names = set()
 
     def visit_Name(self, node: ast.Name):
@@ -17,8 +21,30 @@ class UsedNames(ast.NodeVisitor):
     def visit_ClassDef(self, node: ast.ClassDef):
         self.names.add(node.name)
 
-@lru_cache()
+_DEFS = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
 def used_names(tree: ast.AST):
-    visitor = UsedNames()
-    visitor.visit(tree)
-    return visitor.names
+    '''
+    Collects the same names as UsedNames: the names of the Name nodes and
+    defs which are not nested in a def.  They are the outer_names of the
+    NameFacts of tree, or are found with a scan over its columns if it is a
+    ColumnarTree.
+    '''
+    if not isinstance(tree, ColumnarTree):
+        return name_facts(tree).outer_names
+    columns = tree
+    ends = columns.ends
+    idents = columns.idents
+    strings = columns.strings
+    defs = set(columns.codes_of(_DEFS))
+    kinds = columns.kinds
+    names = set()
+    # the bodies of defs are skipped
+    end = 0
+    for i in columns.find((ast.Name,) + _DEFS):
+        if i < end:
+            continue
+        names.add(strings[idents[i]])
+        if kinds[i] in defs:
+            end = ends[i]
+    return names
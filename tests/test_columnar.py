@@ -0,0 +1,99 @@
+import pytest
+import ast
+
+import inspect
+from ast_tools.columnar import ColumnarTree, STORE
+from ast_tools.visitors import NameCollector, TargetCollector, UsedNames
+from ast_tools.visitors import collect_names, collect_targets, used_names
+
+
+trees = []
+
+for mod in (inspect, ast, pytest):
+    with open(mod.__file__, 'r') as f:
+        text = f.read()
+    trees.append(ast.parse(text))
+
+
+@pytest.mark.parametrize("tree", trees)
+def test_round_trip(tree):
+    columns = ColumnarTree.from_ast(tree)
+    assert len(columns) == len(columns.nodes)
+    new_tree = columns.to_ast()
+    assert ast.dump(new_tree, include_attributes=True) \
+        == ast.dump(tree, include_attributes=True)
+    compile(new_tree, '<test>', 'exec')
+
+
+def test_round_trip_mixed_lists():
+    tree = ast.parse('{**a, b: c}\nglobal x, y\ndef f(*, k=1, **kw): pass')
+    new_tree = ColumnarTree.from_ast(tree).to_ast()
+    assert ast.dump(new_tree) == ast.dump(tree)
+
+
+def test_scalars():
+    tree = ast.parse('def f(x) -> None: return x\nimport a as b\n1')
+    columns = ColumnarTree.from_ast(tree)
+    # None fields are the default of node_fields and are not stored
+    assert all(v is not None for extra in columns.scalars.values()
+               for v in extra.values())
+    assert ast.dump(columns.to_ast()) == ast.dump(tree)
+
+
+def test_targets_without_nodes():
+    tree = ast.parse('x = y\nself.a, b = c')
+    columns = ColumnarTree.from_ast(tree)
+    columns.nodes = None
+    targets = collect_targets(columns)
+    assert sorted(ast.dump(t) for t in targets) == \
+        sorted(ast.dump(t) for t in collect_targets(tree))
+
+
+def test_structure():
+    tree = ast.parse('self.x = y\nz = self.w')
+    columns = ColumnarTree.from_ast(tree)
+    for i, node in enumerate(columns.nodes):
+        assert columns.types[columns.kinds[i]] is type(node)
+        children = [columns.nodes[c] for c in columns.children(i)]
+        assert children == [
+            c for c in ast.iter_child_nodes(node)
+            if not isinstance(c, ast.expr_context)
+        ]
+        for c in columns.children(i):
+            assert columns.parents[c] == i
+
+    # Attribute stores to self
+    self_id = columns.string_id('self')
+    name = columns.type_code(ast.Name)
+    stores = [
+        i for i in columns.find(ast.Attribute)
+        if columns.ctx[i] == STORE
+        and columns.kinds[i + 1] == name and columns.idents[i + 1] == self_id
+    ]
+    assert [columns.strings[columns.idents[i]] for i in stores] == ['x']
+
+
+@pytest.mark.parametrize("tree", trees)
+def test_collectors(tree):
+    for ctx in (None, ast.Load, ast.Store, ast.Del):
+        visitor = NameCollector(ctx)
+        visitor.visit(tree)
+        assert collect_names(tree, ctx) == visitor.names
+
+    for target_filter in (None, ast.Name, ast.Attribute):
+        visitor = TargetCollector(target_filter)
+        visitor.visit(tree)
+        assert collect_targets(tree, target_filter) == visitor.targets
+
+    visitor = UsedNames()
+    visitor.visit(tree)
+    assert used_names(tree) == visitor.names
+    # the helpers also accept an already built columnar tree
+    columns = ColumnarTree.from_ast(tree)
+    assert used_names(columns) == visitor.names
+    assert collect_names(columns) == collect_names(tree)
+    assert collect_targets(columns) == collect_targets(tree)
+    for stmt in tree.body:
+        visitor = UsedNames()
+        visitor.visit(stmt)
+        assert used_names(stmt) == visitor.names
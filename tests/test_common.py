@@ -68,3 +68,21 @@ def test_exec_in_file():
         return x
 
     assert foo() == 3
+
+
+def test_clone():
+    import inspect
+    from ast_tools.common import clone
+    tree = ast.parse(inspect.getsource(ast))
+    for share_leaves in (False, True):
+        copied = clone(tree, share_leaves)
+        assert ast.dump(copied, include_attributes=True) == \
+                ast.dump(tree, include_attributes=True)
+        for node, c_node in zip(ast.walk(tree), ast.walk(copied)):
+            assert type(node) is type(c_node)
+            if not share_leaves or node._fields and not isinstance(node, ast.Constant):
+                assert node is not c_node
+
+    body = clone(tree.body)
+    assert isinstance(body, list)
+    assert all(a is not b for a, b in zip(body, tree.body))
@@ -0,0 +1,160 @@
+import ast
+import inspect
+
+import astor
+import pytest
+
+import ast_tools
+from ast_tools.passes import begin_rewrite, end_rewrite, loop_unroll, ssa
+from ast_tools.passes import constant_fold, ssa_cleanup
+from ast_tools.stack import SymbolTable
+
+
+def _fold(src, propagate=True):
+    tree = ast.parse(src).body[0]
+    env = SymbolTable({}, {})
+    tree, _, _ = constant_fold(propagate).rewrite(tree, env, {})
+    return astor.to_source(tree)
+
+
+def test_fold_exprs():
+    assert _fold('''\
+def f(x, y):
+    a = x[0 + 1]
+    b = 2 * 3 - -1
+    c = y if 1 < 2 <= 2 else x
+    d = (1 + 2) ** 2 if not True else 'a' * 2
+    e = False or 0 or y
+    g = True and 1 and x and 2
+    h = 1 == 1.0 in (x,)
+    return a, b, c, d, e, g, h
+''', propagate=False) == '''\
+def f(x, y):
+    a = x[1]
+    b = 7
+    c = y
+    d = 'aa'
+    e = y
+    g = x and 2
+    h = 1 == 1.0 in (x,)
+    return a, b, c, d, e, g, h
+'''
+
+
+def test_fold_unsafe():
+    # Nothing here may be folded
+    src = '''\
+def f(x):
+    a = 1 / 0
+    b = 2 ** 1000
+    c = 'a' * 100000
+    d = '%99999999d' % 1
+    e = 1 << 100000
+    f = x + 1 + 2
+    g = (1, 2) + (3,)
+    return a, b, c, d, e, f, g
+'''
+    assert _fold(src) == src
+
+
+def test_propagate():
+    assert _fold('''\
+def f(x):
+    a = 1
+    b = a + 1
+    if b > 1:
+        c = x
+    else:
+        c = 0
+    a2 = a
+    d = [i for i in x]
+    return c + b * a2
+''') == '''\
+def f(x):
+    a = 1
+    b = 2
+    c = x
+    a2 = 1
+    d = [i for i in x]
+    return c + 2
+'''
+
+
+def test_unroll_fold():
+    @end_rewrite()
+    @ssa_cleanup()
+    @constant_fold()
+    @ssa()
+    @loop_unroll()
+    @begin_rewrite()
+    def f(x):
+        y = 0
+        for i in ast_tools.macros.unroll(range(3)):
+            y = y + x[i + 1] * (2 ** i)
+        return y
+
+    assert inspect.getsource(f) == '''\
+def f(x):
+    y1 = 0 + x[1] * 1
+    y2 = y1 + x[2] * 2
+    y3 = y2 + x[3] * 4
+    return y3
+'''
+    assert f([0, 1, 2, 3]) == 1 + 4 + 12
+
+
+def test_no_propagate_scoped():
+    src = '''\
+def f(x):
+    a = 1
+    d = [(a + i) for i in x]
+    return a
+'''
+    assert _fold(src) == src
+
+
+def test_dead_branch_scope():
+    # Dead branches which make f a generator or bind locals are kept
+    for src in ('''\
+def f(x):
+    if False:
+        yield x
+    return x
+''', '''\
+def f(x):
+    if 1 > 2:
+        global y
+    y = x
+    return y
+''', '''\
+def f(x):
+    if not True:
+        x, y = 1, 2
+    return y
+'''):
+        assert _fold(src, propagate=False) == src.replace('1 > 2', 'False') \
+            .replace('not True', 'False')
+
+    # Names bound by both branches stay locals, the check does not look
+    # outside of the if so g is kept
+    assert _fold('''\
+def f(x):
+    if True:
+        y = x
+    else:
+        y = 0
+    def g():
+        return 1
+    if False:
+        g = None
+    return y
+''', propagate=False) == '''\
+def f(x):
+    y = x
+
+    def g():
+        return 1
+    if False:
+        g = None
+    return y
+'''
@@ -0,0 +1,122 @@
+import ast
+import inspect
+import random
+
+import astor
+import pytest
+
+from ast_tools.passes import begin_rewrite, end_rewrite, ssa, cse, debug
+from ast_tools.stack import SymbolTable
+
+
+def _cse(src):
+    tree = ast.parse(src).body[0]
+    env = SymbolTable({}, {})
+    tree, _, _ = cse().rewrite(tree, env, {})
+    return astor.to_source(tree)
+
+
+def test_docstring_example():
+    assert _cse('''\
+def f(a, c, cond):
+    x0 = a.b + c
+    x1 = a.b + c + 1
+    __return_value0 = x0 * (a.b + c) if cond else x1
+    return __return_value0
+''') == '''\
+def f(a, c, cond):
+    __cse0 = a.b + c
+    x0 = __cse0
+    x1 = __cse0 + 1
+    __return_value0 = x0 * __cse0 if cond else x1
+    return __return_value0
+'''
+
+
+def test_nested_repeats():
+    assert _cse('''\
+def f(a, b):
+    x = (a + b) * 2
+    y = (a + b) * 2 - (a + b)
+    z = a + b
+    return x, y, z
+''') == '''\
+def f(a, b):
+    __cse0 = a + b
+    __cse1 = __cse0 * 2
+    x = __cse1
+    y = __cse1 - __cse0
+    z = __cse0
+    return x, y, z
+'''
+
+
+def test_barriers():
+    # Nothing here may be shared
+    src = '''\
+def f(a, b, t):
+    x = t.y + 1
+    g(t)
+    y = t.y + 1
+    u = a + b
+    a = 0
+    v = a + b
+    w = h(t.y * 2, t.y * 2)
+    z = a / b if b else a / b
+    return x, y, u, v, w, z
+'''
+    assert _cse(src) == src
+
+
+class Thing:
+    def __init__(self, x=None):
+        self.x = x
+
+
+@pytest.mark.parametrize('strict', [True, False])
+def test_cse_ssa(strict):
+    def f1(t, a, b, c):
+        if a:
+            t.x = (b + c) * t.y
+            r = (b + c) * t.y + 1
+        else:
+            r = (b + c) * t.y - 1
+        return r
+
+    f2 = f1
+    for dec in (begin_rewrite(),
+                ssa(strict),
+                cse(),
+                debug(dump_src=True),
+                end_rewrite()):
+        f2 = dec(f2)
+
+    assert inspect.getsource(f2).count('b + c') == 1
+
+    t1, t2 = Thing(), Thing()
+    for _ in range(16):
+        t1.y = t2.y = random.randint(0, 3)
+        args = [random.randint(0, 3) for _ in range(3)]
+        assert f1(t1, *args) == f2(t2, *args)
+        assert t1.x == t2.x
+
+
+def test_named_expr():
+    # x + 1 reads the x assigned by := so is not shared with the first
+    # statement, a * 2 does not depend on y so is
+    assert _cse('''\
+def f(x):
+    a = x + 1
+    b = a * 2
+    c = (x := 2) + (x + 1)
+    d = (y := 1) + a * 2
+    return a, b, c, d
+''') == '''\
+def f(x):
+    a = x + 1
+    __cse0 = a * 2
+    b = __cse0
+    c = (x := 2) + (x + 1)
+    d = (y := 1) + __cse0
+    return a, b, c, d
+'''
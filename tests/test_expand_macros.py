@@ -0,0 +1,73 @@
+import ast
+import inspect
+
+import astor
+
+import ast_tools
+from ast_tools import macros
+from ast_tools.macros import inline, unroll
+from ast_tools.passes import begin_rewrite, end_rewrite, expand_macros
+from ast_tools.transformers.macro_expander import expand_macros as expand
+
+
+def test_unroll_exposes_inline():
+    @end_rewrite()
+    @expand_macros()
+    @begin_rewrite()
+    def foo(x):
+        for i in unroll(range(3)):
+            if inline(i == 1):
+                x = x + i
+            else:
+                for j in unroll(range(i)):
+                    x = x * j
+        return x
+
+    assert inspect.getsource(foo) == '''\
+def foo(x):
+    x = x + 1
+    x = x * 0
+    x = x * 1
+    return x
+'''
+
+
+def test_inline_exposes_unroll():
+    tree = ast.parse('''
+def foo():
+    if inline(n):
+        for i in unroll(range(n)):
+            print(i)
+''')
+    env = dict(globals(), n=2)
+    assert astor.to_source(expand(tree, env)) == '''\
+def foo():
+    print(0)
+    print(1)
+'''
+
+
+class unless:
+    def __init__(self, cond):
+        self.cond = cond
+
+
+def _expand_unless(node, macro, env, root):
+    return node.orelse if macro.cond else node.body
+
+
+def test_user_macro(monkeypatch):
+    monkeypatch.setitem(macros._REGISTRY, unless, {ast.If: ('test', _expand_unless)})
+    tree = ast.parse('''
+def foo():
+    for i in unroll(range(2)):
+        if unless(i):
+            print(i)
+        else:
+            print(-i)
+''')
+    assert astor.to_source(expand(tree, globals())) == '''\
+def foo():
+    print(0)
+    print(-1)
+'''
@@ -1,7 +1,9 @@
 import pytest
 import ast
 
+import copy
 import inspect
+import sys
 from ast_tools import immutable_ast
 from ast_tools.immutable_ast import ImmutableMeta
 
@@ -88,3 +90,255 @@ def test_construct_from_mutable():
     assert isinstance(node.body, tuple)
     assert type(node.body[0]) is immutable_ast.Name
     assert type(node.body[0].ctx) is immutable_ast.Store
+
+
+def test_slots():
+    node = immutable_ast.Name(id='foo', ctx=immutable_ast.Load())
+    assert immutable_ast.Name.__slots__ == ('id', 'ctx')
+    assert not hasattr(node, '__dict__')
+    hash(node)
+
+    node.meta = 1
+    copied = copy.deepcopy(node)
+    assert copied == node and copied is not node
+    assert copied.meta == 1
+
+
+def test_memory():
+    # immutable nodes hold only their fields, the cached hash and two
+    # pointers, and so are smaller than ast nodes with their __dict__
+    text = inspect.getsource(inspect)
+    tree = ast.parse(text)
+    itree = immutable_ast.immutable(tree)
+    for node, inode in zip(ast.walk(tree), immutable_ast.walk(itree)):
+        assert type(inode).__slots__ is not None
+        assert not hasattr(inode, '__dict__')
+        assert sys.getsizeof(inode) < \
+            sys.getsizeof(node) + sys.getsizeof(node.__dict__)
+
+
+def test_intern():
+    src = 'x = (x + 1) * (x + 1) + True + 1.0'
+    itree = immutable_ast.intern(ast.parse(src))
+    jtree = immutable_ast.intern(immutable_ast.parse(src))
+    assert itree is jtree
+
+    mult, = [n for n in immutable_ast.walk(itree)
+             if isinstance(n, immutable_ast.BinOp)
+             and isinstance(n.op, immutable_ast.Mult)]
+    assert mult.left is mult.right
+    assert mult.left.left is mult.right.left
+
+    # constants of different type or sign are not merged
+    constants = [n for n in immutable_ast.walk(itree)
+                 if isinstance(n, immutable_ast.Constant)]
+    assert len({id(n) for n in constants}) == 3
+    zero = immutable_ast.intern(immutable_ast.Constant(0.0, None))
+    assert immutable_ast.intern(immutable_ast.Constant(-0.0, None)) is not zero
+
+    # interning an interned tree is the identity
+    assert immutable_ast.intern(itree) is itree
+    assert immutable_ast.mutable(itree).__class__ is ast.Module
+
+
+def test_mutable_does_not_alias():
+    itree = immutable_ast.immutable(ast.parse('x = a + b'))
+    tree = immutable_ast.mutable(
+        immutable_ast.Module(itree.body + itree.body, ()))
+    assert tree.body[0] is not tree.body[1]
+
+    itree = immutable_ast.intern(ast.parse('x = a + b\ny = a + b'))
+    assert itree.body[0].value is itree.body[1].value
+    tree = immutable_ast.mutable(itree)
+    assert tree.body[0].value is not tree.body[1].value
+
+    class Renamer(ast.NodeTransformer):
+        def visit_Name(self, node):
+            if node.id == 'a':
+                node.id = 'c'
+            return node
+    Renamer().visit(tree.body[0])
+    assert [n.id for n in ast.walk(tree) if isinstance(n, ast.Name)] \
+        == ['x', 'y', 'c', 'b', 'a', 'b']
+
+
+def test_hash_order():
+    a_b, b_a = immutable_ast.parse('a - b\nb - a').body
+    assert hash(a_b.value) != hash(b_a.value)
+    assert a_b.value != b_a.value
+
+    ab = immutable_ast.parse('a\nb')
+    ba = immutable_ast.parse('b\na')
+    assert hash(ab) != hash(ba)
+    assert ab != ba
+
+
+def test_hash_eq_deep():
+    def chain(n):
+        node = immutable_ast.Name('x', immutable_ast.Load())
+        for _ in range(n):
+            node = immutable_ast.BinOp(node, immutable_ast.Add(), node)
+        return node
+
+    left, right = chain(10 ** 5), chain(10 ** 5)
+    assert hash(left) == hash(right)
+    assert left == right
+    assert left != chain(10 ** 5 - 1)
+
+
+def test_convert_deep():
+    tree = ast.Name('x', ast.Load())
+    for _ in range(10 ** 5):
+        tree = ast.UnaryOp(ast.USub(), tree)
+
+    itree = immutable_ast.immutable(tree)
+    mtree = immutable_ast.mutable(itree)
+    for node in (itree, mtree):
+        depth = 0
+        while not isinstance(node, immutable_ast.Name):
+            node = node.operand
+            depth += 1
+        assert depth == 10 ** 5
+        assert node.id == 'x'
+    assert type(mtree.operand.operand.operand) is ast.UnaryOp
+
+
+def test_immutable_view():
+    tree = ast.parse('x = y + 1\nz = x')
+    view = immutable_ast.immutable_view(tree)
+    assert isinstance(view, immutable_ast.Module)
+    assert not view._cache
+
+    assign = view.body[0]
+    assert isinstance(assign, immutable_ast.Assign)
+    assert isinstance(view.body, tuple)
+    assert assign.value.right.value == 1
+    # only accessed children are converted
+    assert 'targets' not in assign._cache
+    assert not view.body[1]._cache
+
+    with pytest.raises(AttributeError):
+        assign.value = None
+
+    assert view.materialize() == immutable_ast.immutable(tree)
+    names = [n.id for n in immutable_ast.walk(view) if isinstance(n, immutable_ast.Name)]
+    assert sorted(names) == ['x', 'x', 'y', 'z']
+
+
+def test_transformer_shares_structure():
+    class RenameY(immutable_ast.NodeTransformer):
+        def visit_Name(self, node):
+            if node.id == 'y':
+                return immutable_ast.Name('z', node.ctx)
+            return node
+
+    tree = immutable_ast.parse('a = b + c\nx = f(y)\nd = e')
+    new_tree = RenameY().visit(tree)
+    assert new_tree is not tree
+    assert new_tree.body[0] is tree.body[0]
+    assert new_tree.body[2] is tree.body[2]
+    assert new_tree.body[1].value.func is tree.body[1].value.func
+    assert new_tree.body[1].value.args[0].id == 'z'
+
+    # nothing changed
+    assert RenameY().visit(new_tree) is new_tree
+
+
+def test_zipper():
+    tree = immutable_ast.parse('x = a + b\ny = f(a)\nz = a')
+    is_a = lambda n: isinstance(n, immutable_ast.Name) and n.id == 'a'
+    paths = list(immutable_ast.locate(tree, is_a))
+    assert paths == [
+        (('body', 0), ('value', None), ('left', None)),
+        (('body', 1), ('value', None), ('args', 0)),
+        (('body', 2), ('value', None)),
+    ]
+    for path in paths:
+        assert immutable_ast.get_at(tree, path).id == 'a'
+
+    one = immutable_ast.Constant(1, None)
+    new_tree = immutable_ast.replace_at(tree, paths[0], one)
+    assert new_tree.body[0].value.left is one
+    assert new_tree.body[0].value.right is tree.body[0].value.right
+    assert new_tree.body[1] is tree.body[1]
+    assert new_tree.body[2] is tree.body[2]
+
+    # batched edits share rebuilt ancestors
+    new_tree = immutable_ast.replace_all(tree, {path: one for path in paths})
+    assert not list(immutable_ast.locate(new_tree, is_a))
+    assert new_tree == immutable_ast.parse('x = 1 + b\ny = f(1)\nz = 1')
+
+    # splice and delete statements
+    stmts = immutable_ast.parse('p\nq').body
+    new_tree = immutable_ast.replace_all(tree, {
+        (('body', 0),): stmts,
+        (('body', 2),): None,
+    })
+    assert new_tree == immutable_ast.parse('p\nq\ny = f(a)')
+
+    with pytest.raises(ValueError):
+        immutable_ast.replace_all(tree, {(('body', 0),): one, paths[0]: one})
+    # steps which do not match the tree
+    for path in ((('body', None),), (('body', 3),), (('body', 0), ('value', 0)),
+                 (('body', 0), ('missing', None)), (('body', 0), ('value', None), ('left', 0))):
+        with pytest.raises(ValueError):
+            immutable_ast.replace_at(tree, path, one)
+
+
+def test_generated_traversal():
+    tree = immutable_ast.parse('{1: a, **b}\ndef f(x, *, y=1, z): return x')
+    d = tree.body[0].value
+    assert immutable_ast.Dict._child_fields == (('keys', True), ('values', True))
+    # the None key of **b is not a child
+    assert len(d._children()) == 3
+
+    f = tree.body[1]
+    assert f._children() == (f.args, *f.body)
+    assert f._rebuild([f.args, (), (), None]).body == ()
+    assert f._rebuild([f.args, (), (), None]).name == 'f'
+    # _rebuild takes the values of the child fields as _child_values
+    # returns them
+    for node in immutable_ast.walk(tree):
+        assert node._rebuild(node._child_values()) == node
+    assert f._child_values() == (f.args, f.body, f.decorator_list, f.returns)
+
+    # plain ast nodes have no generated traversal
+    mutable = ast.parse('{1: a, **b}')
+    assert list(immutable_ast.iter_child_nodes(mutable.body[0].value)) == \
+        list(ast.iter_child_nodes(mutable.body[0].value))
+    assert [type(n) for n in immutable_ast.walk(mutable)] == \
+        [type(n) for n in ast.walk(mutable)]
+
+    # transforming a view materializes it
+    class Negate(immutable_ast.NodeTransformer):
+        def visit_Constant(self, node):
+            return immutable_ast.Constant(-node.value, None)
+
+    view = immutable_ast.immutable_view(ast.parse('x = 1 + y'))
+    new_tree = Negate().visit(view)
+    assert type(new_tree) is immutable_ast.Module
+    assert new_tree.body[0].value.left.value == -1
+    assert new_tree.body[0].targets == immutable_ast.parse('x = 0').body[0].targets
+
+
+def test_isinstance_cache():
+    name = immutable_ast.Name('x', immutable_ast.Load())
+    mname = ast.Name('x', ast.Load())
+    for _ in range(2):
+        assert isinstance(name, immutable_ast.expr)
+        assert isinstance(mname, immutable_ast.expr)
+        assert not isinstance(mname, immutable_ast.stmt)
+        assert not isinstance(1, immutable_ast.AST)
+        assert issubclass(ast.Name, immutable_ast.expr)
+        assert not issubclass(ast.Name, immutable_ast.stmt)
+        assert immutable_ast.is_node_of(name, immutable_ast.Name)
+        assert immutable_ast.is_node_of(mname, immutable_ast.expr)
+        assert not immutable_ast.is_node_of(name, immutable_ast.stmt)
+    assert immutable_ast.expr._instance_cache_[ast.Name]
+
+    # views are checked by the class they present
+    body = immutable_ast.immutable_view(ast.parse('x\ndef f(): pass')).body
+    for _ in range(2):
+        assert isinstance(body[0], immutable_ast.Expr)
+        assert not isinstance(body[1], immutable_ast.Expr)
+        assert isinstance(body[1], immutable_ast.FunctionDef)
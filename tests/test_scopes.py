@@ -0,0 +1,172 @@
+import pytest
+import ast
+
+import gc
+import inspect
+import symtable
+from ast_tools import immutable_ast
+from ast_tools.scopes import analyze_scopes, ScopeIndex
+
+
+sources = []
+for mod in (inspect, ast, pytest):
+    with open(mod.__file__, 'r') as f:
+        sources.append(f.read())
+
+
+def _key(table):
+    return table.get_lineno(), table.get_name()
+
+
+def _node_key(scope):
+    node = scope.node
+    if scope.kind == 'lambda':
+        name = 'lambda'
+    elif scope.kind == 'comprehension':
+        name = {'ListComp': 'listcomp', 'SetComp': 'setcomp',
+                'DictComp': 'dictcomp', 'GeneratorExp': 'genexpr'}[type(node).__name__]
+    else:
+        name = node.name
+    return node.lineno, name
+
+
+def _names(names):
+    # symtable also reports the implicit names of the compiler
+    return {n for n in names if not n.startswith('.') and n != '__class__'}
+
+
+def _compare(scope, table):
+    if table.get_type() == 'function':
+        assert _names(scope.locals) == _names(table.get_locals())
+        assert _names(scope.globals) == _names(table.get_globals())
+        assert _names(scope.free) == _names(table.get_frees())
+        assert _names(scope.nonlocals) == _names(table.get_nonlocals())
+    elif table.get_type() == 'class':
+        symbols = table.get_symbols()
+        assert _names(scope.locals) == _names(
+            s.get_name() for s in symbols if s.is_local())
+        assert _names(scope.globals) == _names(
+            s.get_name() for s in symbols if s.is_global())
+        assert _names(scope.free) == _names(
+            s.get_name() for s in symbols if s.is_free())
+
+    children = {}
+    for child in scope.children:
+        children.setdefault(_node_key(child), []).append(child)
+    for child_table in table.get_children():
+        child = children[_key(child_table)].pop(0)
+        _compare(child, child_table)
+
+
+@pytest.mark.parametrize("source", sources, ids=["inspect", "ast", "pytest"])
+def test_matches_symtable(source):
+    tree = ast.parse(source)
+    index = analyze_scopes(tree)
+    table = symtable.symtable(source, '<test>', 'exec')
+    _compare(index.root, table)
+
+    # Immutable nodes have no line numbers to match scopes on
+    itree = immutable_ast.immutable(tree)
+    _same(ScopeIndex(itree).root, index.root)
+
+
+def _same(scope, other):
+    for attr in ('kind', 'locals', 'globals', 'nonlocals', 'free', 'cells'):
+        assert getattr(scope, attr) == getattr(other, attr)
+    assert len(scope.children) == len(other.children)
+    for child, other_child in zip(scope.children, other.children):
+        _same(child, other_child)
+
+
+def test_scopes():
+    tree = ast.parse('''
+import os.path
+x = 1
+def f(a, b=x):
+    global g
+    c = a
+    def h():
+        nonlocal c
+        c = b + y
+        return [c + z for z in os.sep if (w := z)]
+    class C:
+        d = c
+        def m(self):
+            return d
+    return h
+''')
+    index = analyze_scopes(tree)
+    assert index.root.locals == {'os', 'x', 'f'}
+
+    f = tree.body[2]
+    h = f.body[2]
+    C = f.body[3]
+    comp = h.body[2].value
+    fs, hs, Cs, comps = index[f], index[h], index[C], index[comp]
+    assert fs.locals == {'a', 'b', 'c', 'h', 'C'}
+    assert fs.globals == {'g'}
+    assert fs.cells == {'b', 'c'}
+    assert index.scope_of(f.args.defaults[0]) is index.root
+
+    assert hs.nonlocals == {'c'}
+    assert hs.locals == {'w'}
+    assert hs.free == {'b', 'c'}
+    assert hs.globals == {'y', 'os'}
+    assert hs.resolve('c') == 'nonlocal'
+    assert hs.resolve('y') == 'global'
+
+    assert comps.locals == {'z'}
+    assert comps.free == {'c', 'w'}
+    assert index.scope_of(comp.generators[0].iter) is hs
+
+    assert Cs.locals == {'d', 'm'}
+    assert Cs.free == {'c'}
+    # class bodies are not visible to methods
+    assert index[C.body[1]].globals == {'d'}
+    assert index.scope_of(C.body[1]) is Cs
+
+
+def test_mangling():
+    source = '''
+def f():
+    __x = 1
+    class C:
+        __y = 2
+        def __g(self, __a):
+            global __z
+            return __x, __y, __a, __z, __init__
+        class _D:
+            def h(self):
+                return __x
+    return C
+'''
+    tree = ast.parse(source)
+    index = analyze_scopes(tree)
+    _compare(index.root, symtable.symtable(source, '<test>', 'exec'))
+
+    C = tree.body[0].body[1]
+    Cs, gs = index[C], index[C.body[1]]
+    assert Cs.locals == {'_C__y', '_C__g', '_D'}
+    assert gs.locals == {'self', '_C__a'}
+    assert gs.globals == {'_C__x', '_C__y', '_C__z', '__init__'}
+    assert gs.resolve(gs.mangle('__a')) == 'local'
+    assert index[C.body[2].body[0]].globals == {'_D__x'}
+    assert index[tree.body[0]].locals == {'__x', 'C'}
+
+
+def test_function_root():
+    tree = ast.parse('def f(a):\n    return a + b').body[0]
+    index = analyze_scopes(tree)
+    assert index[tree].locals == {'a'}
+    assert index[tree].globals == {'b'}
+    assert index.root.locals == {'f'}
+
+
+def test_cache():
+    tree = ast.parse('x = 1')
+    assert analyze_scopes(tree) is analyze_scopes(tree)
+    assert analyze_scopes(ast.parse('x = 1')) is not analyze_scopes(tree)
+    before = len(analyze_scopes.__globals__['_CACHE'])
+    del tree
+    gc.collect()
+    assert len(analyze_scopes.__globals__['_CACHE']) == before - 1
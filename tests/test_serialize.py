@@ -0,0 +1,132 @@
+import pytest
+import ast
+
+import inspect
+import io
+import pickle
+import timeit
+from ast_tools import immutable_ast, serialize
+
+
+trees = []
+
+for mod in (inspect, ast, pytest):
+    with open(mod.__file__, 'r') as f:
+        text = f.read()
+    trees.append(ast.parse(text))
+
+
+@pytest.mark.parametrize("tree", trees)
+def test_round_trip(tree):
+    data = serialize.dumps(tree)
+    new_tree = serialize.loads(data)
+    assert ast.dump(new_tree, include_attributes=True) \
+        == ast.dump(tree, include_attributes=True)
+    compile(new_tree, '<test>', 'exec')
+
+
+@pytest.mark.parametrize("tree", trees)
+def test_round_trip_immutable(tree):
+    itree = immutable_ast.immutable(tree)
+    data = serialize.dumps(itree)
+    assert serialize.loads(data, immutable=True) == itree
+    # either kind of tree can be read as the other
+    assert serialize.loads(data, immutable=False).body[0].__class__ \
+        is type(tree.body[0])
+    assert serialize.loads(serialize.dumps(tree), immutable=True) == itree
+
+
+def test_constants():
+    values = [None, True, False, 0, -1, 2**100, -2**100, 1.5, 1j, b'\x00\xff',
+              'snowman ☃', Ellipsis, (1, ('a', None)), frozenset({1, 2})]
+    tree = ast.Module(
+        body=[ast.Expr(ast.Constant(v, None)) for v in values],
+        type_ignores=[])
+    new_tree = serialize.loads(serialize.dumps(tree))
+    assert [stmt.value.value for stmt in new_tree.body] == values
+
+    itree = immutable_ast.immutable(tree)
+    new_itree = serialize.loads(serialize.dumps(itree), immutable=True)
+    assert [stmt.value.value for stmt in new_itree.body] == values
+    assert isinstance(new_itree.type_ignores, tuple)
+
+
+def test_shared_subtrees():
+    itree = immutable_ast.intern(immutable_ast.parse('x + x + x + x'))
+    data = serialize.dumps(itree)
+    # Name('x', Load()) is written once
+    assert data.count(b'\x01x') == 1
+    assert data.count(b'Name') == 1
+    new_itree = serialize.loads(data, immutable=True)
+    assert new_itree == itree
+    binop = new_itree.body[0].value
+    assert binop.left.left.right is binop.right
+
+
+def test_deep():
+    tree = ast.Name('x', ast.Load())
+    for _ in range(10000):
+        tree = ast.BinOp(tree, ast.Add(), ast.Name('x', ast.Load()))
+    tree = ast.Expression(tree)
+    new_tree = serialize.loads(serialize.dumps(tree)).body
+    depth = 0
+    while isinstance(new_tree, ast.BinOp):
+        assert new_tree.right.id == 'x'
+        new_tree = new_tree.left
+        depth += 1
+    assert depth == 10000
+
+
+def test_file():
+    tree = trees[0]
+    f = io.BytesIO()
+    serialize.dump(tree, f)
+    f.seek(0)
+    assert ast.dump(serialize.load(f)) == ast.dump(tree)
+
+
+def test_bad_data():
+    with pytest.raises(ValueError):
+        serialize.loads(b'not an ast')
+    with pytest.raises(TypeError):
+        serialize.dumps(ast.Expr(ast.Constant(object(), None)))
+
+
+def test_smaller_than_pickle():
+    tree = trees[0]
+    assert len(serialize.dumps(tree)) * 2 < len(pickle.dumps(tree))
+    itree = immutable_ast.immutable(tree)
+    assert len(serialize.dumps(itree)) * 2 < len(pickle.dumps(itree))
+
+
+def test_faster_than_pickle_immutable():
+    itree = immutable_ast.immutable(trees[0])
+    data = serialize.dumps(itree)
+    pickled = pickle.dumps(itree)
+
+    def best(f):
+        return min(timeit.repeat(f, number=1, repeat=5))
+
+    assert best(lambda: serialize.dumps(itree)) < best(lambda: pickle.dumps(itree))
+    assert best(lambda: serialize.loads(data, immutable=True)) \
+        < best(lambda: pickle.loads(pickled))
+
+
+def test_mutable_not_shared():
+    itree = immutable_ast.intern(ast.parse('x = a + b\ny = a + b'))
+    data = serialize.dumps(itree)
+    tree = serialize.loads(data)
+    assert tree.body[0].value is not tree.body[1].value
+    assert ast.dump(tree) == ast.dump(immutable_ast.mutable(itree))
+    # but the interned structure is kept when loading as immutable
+    new_itree = serialize.loads(data, immutable=True)
+    assert new_itree.body[0].value is new_itree.body[1].value
+
+
+def test_unknown_type():
+    data = bytearray(serialize.dumps(ast.parse('x')))
+    # replace the Module type name by a callable of ast which is not a node
+    i = data.index(b'Module')
+    data[i:i + 6] = b'unpars'
+    with pytest.raises(ValueError):
+        serialize.loads(bytes(data))
@@ -331,11 +331,200 @@ def test_nstrict():
     f2 = _do_ssa(f1, False, dump_src=True)
     assert inspect.getsource(f2) == '''\
 def f1(cond):
+    __cond0 = cond and cond
     __return_value0 = 0
+    __cond1 = not cond
     z0 = 1
+    __cond2 = not cond
     x0 = z0
     __return_value1 = x0
-    return __return_value0 if cond and cond else __return_value1
+    return __return_value0 if __cond0 else __return_value1
 '''
     for cond in [True, False]:
         assert f1(cond) == f2(cond)
+
+
+def test_strict_reports_all_undefined():
+    src = '''\
+def f(cond):
+    if cond:
+        x = 1
+    else:
+        y = 2
+    z = [i + x for i in range(3)]
+    return y
+'''
+    tree = ast.parse(src).body[0]
+    env = SymbolTable({}, {})
+    f = exec_def_in_file(tree, env)
+
+    with pytest.raises(SyntaxError) as excinfo:
+        _do_ssa(f, True)
+
+    msg = str(excinfo.value)
+    assert 'Cannot prove name, x, is defined at line 6' in msg
+    assert 'Cannot prove name, y, is defined at line 7' in msg
+    assert ', i,' not in msg
+
+
+def test_shared_conditions():
+    def f1(t, x, y):
+        if x > y:
+            t.x = 0
+            if x > 2*y:
+                return 0
+            else:
+                return 1
+        elif x < y:
+            t.x = 1
+            return 2
+        return 3
+
+    f2 = _do_ssa(f1, True, dump_src=True)
+    src = inspect.getsource(f2)
+    assert src.count('x > y') == 1
+    assert src.count('x > 2 * y') == 1
+    assert src.count('x < y') == 1
+
+    t1 = Thing()
+    t2 = Thing()
+    for x in range(4):
+        for y in range(4):
+            assert f1(t1, x, y) == f2(t2, x, y)
+            assert t1 == t2
+
+
+def _do_balanced_ssa(func, strict, lookup):
+    for dec in (
+            begin_rewrite(),
+            ssa(strict, balance=True, lookup=lookup),
+            debug(dump_src=True),
+            end_rewrite()):
+        func = dec(func)
+    return func
+
+
+def test_balanced_chain():
+    @end_rewrite()
+    @ssa(balance=True)
+    @begin_rewrite()
+    def f(a, b, c):
+        if a:
+            x = 0
+        elif b:
+            x = 1
+        elif c:
+            x = 2
+        else:
+            x = 3
+        return x
+
+    assert inspect.getsource(f) == '''\
+def f(a, b, c):
+    x0 = 0
+    x1 = 1
+    x2 = 2
+    x3 = 3
+    __cond0 = a or b
+    x4 = (x0 if a else x1) if __cond0 else x2 if c else x3
+    __return_value0 = x4
+    return __return_value0
+'''
+
+
+@pytest.mark.parametrize('strict', [True, False])
+@pytest.mark.parametrize('lookup', [True, False])
+def test_balanced_lookup(strict, lookup):
+    def f1(t, op, a, b):
+        if op == 0:
+            r = a + b
+        elif op == 1:
+            r = a - b
+        elif op == 2:
+            t.x = a
+            return a * b
+        elif op == 3:
+            r = a
+        elif op == 4:
+            t.x = b
+            r = b
+        else:
+            r = 0
+        if r > 3:
+            return 7
+        return r
+
+    f2 = _do_balanced_ssa(f1, strict, lookup)
+    assert ('.get(op, ' in inspect.getsource(f2)) == lookup
+
+    t1 = Thing()
+    t2 = Thing()
+    for op in range(6):
+        for a in range(3):
+            for b in range(3):
+                assert f1(t1, op, a, b) == f2(t2, op, a, b)
+                assert t1 == t2
+
+
+@pytest.mark.parametrize('strict', [True, False])
+def test_balanced_returns(strict):
+    def f1(t, a, b, c, d):
+        t.x = -1
+        if a:
+            t.x = 0
+            return 0
+        elif b and c:
+            t.x = 1
+            return 1
+        elif c:
+            return 2
+        elif d:
+            t.x = 3
+        return 5
+
+    f2 = _do_balanced_ssa(f1, strict, True)
+
+    t1 = Thing()
+    t2 = Thing()
+    for _ in range(NTEST):
+        args = [random.randint(0, 1) for _ in range(4)]
+        assert f1(t1, *args) == f2(t2, *args)
+        assert t1 == t2
+
+
+@pytest.mark.parametrize('strict', [True, False])
+@pytest.mark.parametrize('lookup', [True, False])
+def test_balanced_chain_rebinds_subject(strict, lookup):
+    def f1(x):
+        if x == 0:
+            x = 5
+            y = 1
+        elif x == 5:
+            y = 2
+        elif x == 7:
+            y = 3
+        else:
+            y = 4
+        return y
+
+    f2 = _do_balanced_ssa(f1, strict, lookup)
+    for x in range(10):
+        assert f1(x) == f2(x)
+
+
+def test_attr_replacer():
+    import astor
+    from ast_tools.passes.ssa import AttrReplacer
+
+    tree = ast.parse('''\
+t.x = t.x + t.y.x
+del t.x
+''')
+    target = tree.body[0].targets[0]
+    replacer = AttrReplacer({})
+    replacer.add_replacement(target, ast.Name('t_x', ast.Store()))
+    tree = replacer.visit(tree)
+    assert astor.to_source(tree) == '''\
+t_x = t_x + t.y.x
+del t.x
+'''
@@ -0,0 +1,112 @@
+import ast
+import inspect
+import random
+
+import pytest
+
+from ast_tools.common import exec_def_in_file
+from ast_tools.passes import begin_rewrite, end_rewrite, ssa, ssa_cleanup, debug
+from ast_tools.stack import SymbolTable
+
+
+class Thing:
+    def __init__(self, x=None):
+        self.x = x
+
+
+def test_cleanup_attrs():
+    @end_rewrite()
+    @ssa(cleanup=True)
+    @begin_rewrite()
+    def f(t, cond):
+        if cond:
+            t.x = 1
+        else:
+            t.x = 0
+        return cond
+
+    assert inspect.getsource(f) == '''\
+def f(t, cond):
+    t_x1 = 1
+    t_x2 = 0
+    t_x3 = t_x1 if cond else t_x2
+    t.x = t_x3
+    return cond
+'''
+    t = Thing()
+    assert f(t, True) and t.x == 1
+    assert not f(t, False) and t.x == 0
+
+
+def test_cleanup_same_mux():
+    @end_rewrite()
+    @ssa_cleanup()
+    @begin_rewrite()
+    def f(a, c):
+        x = a
+        y = x if c else x
+        z = y + 1
+        w = z * 2
+        print(w)
+        return y
+
+    assert inspect.getsource(f) == '''\
+def f(a, c):
+    z = a + 1
+    w = z * 2
+    print(w)
+    return a
+'''
+
+
+def test_cleanup_keeps_calls_and_scopes():
+    @end_rewrite()
+    @ssa_cleanup()
+    @begin_rewrite()
+    def f(a):
+        b = a
+        x = print(b)
+        y = b
+        g = lambda: y
+        a = 2
+        return g
+
+    assert inspect.getsource(f) == '''\
+def f(a):
+    b = a
+    x = print(b)
+    y = b
+    g = lambda : y
+    a = 2
+    return g
+'''
+
+
+@pytest.mark.parametrize('balance', [True, False])
+def test_cleanup_equiv(balance):
+    def f1(t, a, b, c):
+        t.x = a
+        if a > b:
+            t.x = b
+            r = a
+            if c:
+                return r
+        elif a < b:
+            r = b
+        else:
+            r = c
+        return r + 1
+
+    f2 = f1
+    for dec in (begin_rewrite(),
+                ssa(balance=balance, cleanup=True),
+                debug(dump_src=True),
+                end_rewrite()):
+        f2 = dec(f2)
+
+    t1 = Thing()
+    t2 = Thing()
+    for _ in range(32):
+        args = [random.randint(0, 3) for _ in range(3)]
+        assert f1(t1, *args) == f2(t2, *args)
+        assert t1.x == t2.x
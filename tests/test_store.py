@@ -0,0 +1,97 @@
+import pytest
+import ast
+
+import inspect
+import multiprocessing
+from ast_tools import immutable_ast
+from ast_tools.store import ASTStore, StoredView, write_store
+from ast_tools.visitors import collect_names, used_names
+
+
+with open(inspect.__file__, 'r') as f:
+    tree = ast.parse(f.read())
+
+
+@pytest.fixture
+def store_path(tmp_path):
+    path = str(tmp_path / 'trees.store')
+    write_store(path, {
+        'inspect': tree,
+        'small': ast.parse('x = {**a, b: (1, 2.5)}\nglobal y'),
+    })
+    return path
+
+
+def test_views(store_path):
+    with ASTStore(store_path) as store:
+        assert set(store) == {'inspect', 'small'}
+        assert 'small' in store and 'missing' not in store
+
+        view = store['small']
+        assert type(view) is StoredView
+        assert issubclass(StoredView, immutable_ast.LazyView)
+        assert isinstance(view, immutable_ast.Module)
+        assign = view.body[0]
+        assert isinstance(assign, immutable_ast.Assign)
+        assert assign.targets[0].id == 'x'
+        assert isinstance(assign.targets[0].ctx, immutable_ast.Store)
+        assert assign.value.keys[0] is None
+        assert view.body[1].names == ('y',)
+        with pytest.raises(AttributeError):
+            view.body = ()
+
+        expected = immutable_ast.immutable(ast.parse('x = {**a, b: (1, 2.5)}\nglobal y'))
+        assert view.materialize() == expected
+        assert immutable_ast.immutable(tree) == store['inspect'].materialize()
+
+
+def test_lazy(store_path):
+    with ASTStore(store_path) as store:
+        view = store['inspect']
+        first, last = view.body[0], view.body[-1]
+        first.value
+        # Only the accessed nodes have been built
+        assert view._cache is not None and first._cache is not None
+        assert last._cache is None and first.value._cache is None
+
+
+def test_visitors(store_path):
+    with ASTStore(store_path) as store:
+        names = set()
+        class Visitor(immutable_ast.NodeVisitor):
+            def visit_Name(self, node):
+                names.add(node.id)
+        Visitor().visit(store['inspect'])
+        assert names == collect_names(tree)
+
+        # The scan based collectors work on the columns in the file
+        columns = store.columns('inspect')
+        assert type(columns.kinds) is memoryview
+        assert collect_names(columns) == collect_names(tree)
+        assert used_names(columns) == used_names(tree)
+
+        class Renamer(immutable_ast.NodeTransformer):
+            def visit_Name(self, node):
+                return immutable_ast.Name(node.id + '_', node.ctx)
+        new_tree = Renamer().visit(store['small'])
+        assert immutable_ast.mutable(new_tree).body[0].targets[0].id == 'x_'
+
+
+def _worker(args):
+    path, key = args
+    with ASTStore(path) as store:
+        return sorted(collect_names(store.columns(key)))
+
+
+def test_processes(store_path):
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(2) as pool:
+        results = pool.map(_worker, [(store_path, 'inspect'), (store_path, 'small')])
+    assert results == [sorted(collect_names(tree)), ['a', 'b', 'x']]
+
+
+def test_bad_file(tmp_path):
+    path = tmp_path / 'bad'
+    path.write_bytes(b'\0' * 64)
+    with pytest.raises(ValueError):
+        ASTStore(str(path))
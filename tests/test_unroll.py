@@ -218,3 +218,106 @@ def foo():
     print(2)
     print(3)
 """
+
+
+def test_partial_unroll():
+    tree = ast.parse("""
+def foo():
+    for i in ast_tools.macros.unroll(range(7), factor=3):
+        print(i)
+""")
+    assert astor.to_source(unroll_for_loops(tree, globals())) == """\
+def foo():
+    for __i_base in range(0, 6, 3):
+        print(__i_base)
+        print(__i_base + 1)
+        print(__i_base + 2)
+    for i in (6,):
+        print(i)
+"""
+
+
+def test_partial_unroll_list():
+    tree = ast.parse("""
+def foo():
+    for i in ast_tools.macros.unroll([4, 1, 3, 2], factor=2):
+        print(i * i)
+""")
+    assert astor.to_source(unroll_for_loops(tree, globals())) == """\
+def foo():
+    for __i_0, __i_1 in ((4, 1), (3, 2)):
+        print(__i_0 * __i_0)
+        print(__i_1 * __i_1)
+"""
+
+
+def test_partial_unroll_semantics():
+    def foo():
+        acc = []
+        for i in ast_tools.macros.unroll(range(10, 0, -2), factor=2):
+            for j in ast_tools.macros.unroll([5, 1, 2], factor=2):
+                acc.append(i * j)
+        return acc
+
+    bar = end_rewrite()(loop_unroll()(begin_rewrite()(foo)))
+    assert bar() == foo()
+
+
+def test_only_macros_evaluated():
+    calls = []
+    def side_effect():
+        calls.append(None)
+        return ast_tools.macros.unroll(range(2))
+
+    tree = ast.parse("""
+def foo():
+    for i in side_effect():
+        print(i)
+    for i in ast_tools.macros.unroll([k * k for k in range(n)]):
+        print(i)
+""")
+    env = dict(globals(), side_effect=side_effect, n=3)
+    assert astor.to_source(unroll_for_loops(tree, env)) == """\
+def foo():
+    for i in side_effect():
+        print(i)
+    print(0)
+    print(1)
+    print(4)
+"""
+    assert not calls
+
+
+def test_partial_unroll_exits():
+    tree = ast.parse("""
+def foo(acc):
+    for i in ast_tools.macros.unroll(range(5), factor=2):
+        if i % 2 == 0:
+            continue
+        acc.append(i)
+""")
+    with pytest.raises(NotImplementedError):
+        unroll_for_loops(tree, globals())
+
+    # break in a nested loop is fine
+    tree = ast.parse("""
+def foo(acc):
+    for i in ast_tools.macros.unroll(range(3), factor=2):
+        while True:
+            break
+""")
+    unroll_for_loops(tree, globals())
+
+
+@pytest.mark.parametrize('factor', [None, 2])
+def test_unroll_else(factor):
+    def foo():
+        acc = []
+        for i in ast_tools.macros.unroll(range(3), factor=factor):
+            acc.append(i)
+        else:
+            acc.append(-1)
+        return acc
+
+    bar = end_rewrite()(loop_unroll()(begin_rewrite()(foo)))
+    assert bar() == foo() == [0, 1, 2, -1]
@@ -5,6 +5,7 @@ import ast
 from ast_tools.visitors import collect_names
 from ast_tools.visitors import collect_targets
 from ast_tools.visitors import UsedNames
+from ast_tools.visitors import name_facts, used_names
 
 def test_collect_names_basic():
     """
@@ -87,3 +88,112 @@ x.attr = 2
     targets = collect_targets(tree, ast.Attribute)
     for t in targets:
         _check_attr(t)
+
+
+def test_dispatch_visitor():
+    from ast_tools.visitors import DispatchVisitor
+
+    class Order(DispatchVisitor):
+        def __init__(self):
+            super().__init__()
+            self.order = []
+
+        def visit_Name(self, node):
+            self.order.append(node.id)
+
+        def visit_BinOp(self, node):
+            self.order.append('(')
+            # children are visited before generic_visit returns
+            self.generic_visit(node)
+            self.order.append(')')
+
+    visitor = Order()
+    visitor.visit(ast.parse('a + b\nc'))
+    assert visitor.order == ['(', 'a', 'b', ')', 'c']
+    visitor = Order()
+    visitor.visit(ast.parse('(a + b) + c').body[0])
+    assert visitor.order == ['(', '(', 'a', 'b', ')', 'c', ')']
+
+    # handlers are looked up once per class
+    assert Order._handlers == {
+        ast.Name: Order.visit_Name, ast.BinOp: Order.visit_BinOp}
+
+    # deep trees do not recurse
+    tree = ast.Name('x', ast.Load())
+    for _ in range(10 ** 5):
+        tree = ast.UnaryOp(ast.USub(), tree)
+    assert collect_names(tree) == {'x'}
+
+
+def test_dispatch_transformer():
+    from ast_tools.transformers import Renamer
+    import astor
+
+    tree = ast.parse('def f(a):\n    return a + b\n')
+    tree = Renamer({'a': 'x'}).visit(tree)
+    assert astor.to_source(tree) == 'def f(a):\n    return x + b\n'
+
+
+def test_name_facts():
+    tree = ast.parse('''
+import os
+x = y = 1
+x += z
+a: int = b
+for i in range(3):
+    del x
+with open(f) as (fh, other):
+    self.attr = fh
+class A:
+    def f(self, q):
+        w = q
+''')
+    facts = name_facts(tree)
+    assert facts.loads == {'z', 'b', 'int', 'range', 'open', 'f', 'self', 'fh', 'q'}
+    assert facts.stores == {'x', 'y', 'a', 'i', 'fh', 'other', 'w'}
+    assert facts.dels == {'x'}
+    assert facts.defs == {'A', 'f'}
+    assert facts.outer_names == (facts.loads | facts.stores | {'A'}) - {'q', 'w'}
+    assert [ast.unparse(t) for t in facts.assign_targets] == ['x', 'y', 'self.attr', 'w']
+    targets = [ast.unparse(t) for t in facts.targets]
+    assert sorted(targets) == sorted(
+        ['x', 'y', 'x', 'a', 'i', '(fh, other)', 'self.attr', 'w'])
+    assert [ast.unparse(t) for t in facts.attribute_stores] == ['self.attr']
+
+    # The helpers are projections of the facts
+    assert collect_names(tree) == facts.names()
+    assert collect_names(tree, ast.Store) == facts.stores
+    assert collect_targets(tree) == set(facts.assign_targets)
+    assert used_names(tree) == facts.outer_names
+
+
+def test_name_facts_cached():
+    import gc
+    import importlib
+    name_facts_module = importlib.import_module('ast_tools.visitors.name_facts')
+    cache = name_facts_module._CACHE
+
+    tree = ast.parse('x = y\ndef f(): z')
+    facts = name_facts(tree)
+    assert name_facts(tree) is facts
+    # the helpers share the walk
+    walks = []
+    class Counting(name_facts_module.NameFactsCollector):
+        def visit(self, node):
+            walks.append(node)
+            return super().visit(node)
+    other = ast.parse('a = b')
+    old = name_facts_module.NameFactsCollector
+    name_facts_module.NameFactsCollector = Counting
+    try:
+        collect_names(other)
+        collect_targets(other)
+        used_names(other)
+    finally:
+        name_facts_module.NameFactsCollector = old
+    assert walks.count(other) == 1
+
+    before = len(cache)
+    del tree, facts, other, walks
+    gc.collect()
+    assert len(cache) == before - 2
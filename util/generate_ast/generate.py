@@ -2,6 +2,7 @@ import ast
 import datetime
 import inspect
 from os import path
+import re
 import sys
 
 _BASE_PATH = path.dirname(__file__)
@@ -13,7 +14,70 @@ FUNCTIONS_FILE = _make_path('_functions.px')
 AST_BASE_FILE = _make_path('_base.px')
 TAB = ' '*4
 
-def generate_class(name, bases, fields):
+# ASDL types of fields which never hold nodes
+_SCALAR_TYPES = frozenset(('identifier', 'string', 'int', 'constant'))
+_SIGNATURE = re.compile(r'(\w+)([?*]?) (\w+)')
+
+def child_fields(cls):
+    '''
+    Returns ((field, is_sequence, is_optional), ...) for the fields of cls
+    which hold nodes, read from the ASDL signature in its docstring.
+    Fields missing from the signature (the deprecated constant classes)
+    hold constants.
+    '''
+    doc = (cls.__doc__ or '').split('\n', 1)[0]
+    types = {field: (type_, mod) for type_, mod, field in _SIGNATURE.findall(doc)}
+    r = []
+    for field in cls._fields:
+        type_, mod = types.get(field, ('constant', ''))
+        if type_ not in _SCALAR_TYPES:
+            r.append((field, mod == '*', mod == '?'))
+    return tuple(r)
+
+def generate_traversal(name, fields, children):
+    '''
+    Generate _child_fields, _children, _child_values and _rebuild
+    specialized to the fields of the class
+    '''
+    child_fields = tuple((f, is_seq) for f, is_seq, _ in children)
+    if not children:
+        return f'''\
+{TAB}_child_fields=()
+{TAB}def _children(self):
+{TAB}{TAB}return ()
+{TAB}def _child_values(self):
+{TAB}{TAB}return ()
+{TAB}def _rebuild(self, children):
+{TAB}{TAB}return self
+'''
+
+    elts = ', '.join(
+        f'*self.{f}' if is_seq else f'self.{f}' for f, is_seq, _ in children)
+    if any(is_seq or is_opt for _, is_seq, is_opt in children):
+        # sequences may hold None (e.g. Dict.keys) as may optional fields
+        children_body = f'return tuple(c for c in ({elts},) if c is not None)'
+    else:
+        children_body = f'return ({elts},)'
+
+    values = ', '.join(f'self.{f}' for f, _, _ in children)
+
+    idx = {f: i for i, (f, _, _) in enumerate(children)}
+    args = ', '.join(
+        f'children[{idx[f]}]' if f in idx else f'self.{f}' for f in fields)
+
+    return f'''\
+{TAB}_child_fields={child_fields}
+{TAB}def _children(self):
+{TAB}{TAB}{children_body}
+{TAB}def _child_values(self):
+{TAB}{TAB}return ({values},)
+{TAB}def _rebuild(self, children):
+{TAB}{TAB}return {name}({args})
+'''
+
+def generate_class(name, bases, fields, base_fields=()):
+    # fields already stored in a slot of a base are not redeclared
+    slots = tuple(f for f in fields if f not in base_fields)
     bases=', '.join(bases) + (', ' if bases else '')
     sig = (', ' if fields else '') + ', '.join(fields)
     body = [f'self.{arg} = {arg}' for arg in fields]
@@ -24,15 +88,16 @@ def generate_class(name, bases, fields):
 
     class_ = f'''\
 class {name}({bases}mutable=ast.{name}):
+{TAB}__slots__={slots}
 {TAB}_fields={fields}
 {TAB}def __init__(self{sig}):
 {TAB}{TAB}{body}
-'''
+{generate_traversal(name, fields, child_fields(getattr(ast, name)))}'''
 
     return class_
 
 def generate_classes(class_tree, ALL):
-    cls_to_args = {ast.AST : ('AST', (), ())}
+    cls_to_args = {ast.AST : ('AST', (), (), frozenset())}
 
     def pop_args_from_tree(tree):
         for item in tree:
@@ -43,7 +108,12 @@ def generate_classes(class_tree, ALL):
             elif item[0] not in cls_to_args:
                 cls = item[0]
                 bases = tuple(cls_to_args[base][0] for base in item[1] if base is not object)
-                cls_to_args[cls] = r = cls.__name__, bases,  cls._fields
+                base_fields = set()
+                for base in item[1]:
+                    if base in cls_to_args:
+                        base_fields.update(cls_to_args[base][2])
+                        base_fields.update(cls_to_args[base][3])
+                cls_to_args[cls] = r = cls.__name__, bases,  cls._fields, frozenset(base_fields)
                 return r
 
     classes_ = []
@@ -58,6 +128,22 @@ def generate_classes(class_tree, ALL):
     return '\n'.join(classes_)
 
 
+def generate_tables(names):
+    # Conversion tables: node type -> (converted type, fields)
+    fields = {name: getattr(ast, name)._fields for name in names}
+    to_immutable = [f'{TAB}ast.{name}: ({name}, {fields[name]}),' for name in names]
+    to_mutable = [f'{TAB}{name}: (ast.{name}, {fields[name]}),' for name in names]
+    nl = '\n'
+    return f'''\
+_TO_IMMUTABLE = {{
+{nl.join(to_immutable)}
+}}
+
+_TO_MUTABLE = {{
+{nl.join(to_mutable)}
+}}'''
+
+
 def generate_immutable_ast():
     def _issubclass(t, types):
         try:
@@ -108,6 +194,7 @@ if sys.version_info[:2] != {sys.version_info[:2]}:
         ast_base = f.read()
 
     classes = generate_classes(class_tree, ALL)
+    tables = generate_tables(ALL)
 
     immutable_ast = f'''\
 {head_comment}
@@ -116,6 +203,7 @@ import ast
 import sys
 import typing as tp
 import warnings
+import weakref
 
 {version_check}
 
@@ -128,5 +216,7 @@ __ALL__ = {ALL}
 {ast_base}
 
 {classes}
+
+{tables}
 '''
     return immutable_ast